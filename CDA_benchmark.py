@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the work the experiment does before and between frames:
+generating trials, preparing the trials of a session, setting up the
+stimuli of a trial and writing a trial to disk.
+
+Every run appends one JSON line to the history file (benchmarks.jsonl next
+to this script by default, ignored by git) with the time, git commit, machine and the median, 95th percentile
+and maximum of every benchmark in ms. The table printed after a run compares
+the medians to the previous run on the same machine and shows them as a
+fraction of one frame, i.e. how much of the 16.7 ms at 60 Hz a step takes.
+
+The stimulus setup is that of a CDA_task.Task of SITE: its prepare_arrays
+and compile_trial, as in the ITI of every trial. The stimuli are headless
+stand-ins (see tools/headless.py) unless --display is given, in which case
+the Task opens its real psychopy window.
+
+Usage:
+    python CDA_benchmark.py
+    python CDA_benchmark.py --display --repeats 200
+    python CDA_benchmark.py --only spaced_xys make_trial_list
+"""
+
+from __future__ import division, print_function
+import os
+import json
+import time
+import socket
+import argparse
+import platform
+import tempfile
+import subprocess
+import timeit
+import numpy as np
+
+import CDA_generate_trials
+import CDA_sites
+
+HISTORY_FILENAME = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'benchmarks.jsonl')
+FRAME_RATE = 60
+SET_SIZES = sorted(set(t + d for params in CDA_generate_trials.BANK_CONDITIONS for t in params['Ntargets'] for d in params['Ndistractors']))
+SITE = 'rrlab'  # of the Task whose stimulus setup is timed
+SEED = 2016
+START_INFO = {'start_time': '2016-04-06 09-56-13', 'session': 1, 'frame_rate': FRAME_RATE, 'save_file_name': 'XX 01'}
+TRIGGERS_CUE = CDA_sites.TRIGGERS['cue_codes']
+
+
+def measure(function, repeats, setup=None):
+    """ Seconds taken by each of repeats calls of function(*setup()). setup is not timed. """
+    times = []
+    for _ in range(repeats):
+        args = setup() if setup is not None else ()
+        start = timeit.default_timer()
+        function(*args)
+        times.append(timeit.default_timer() - start)
+    return times
+
+
+def trial_params_name(trial_params):
+    return 'T=%s,D=%s,B=%i,R=%i' % (trial_params['Ntargets'], trial_params['Ndistractors'], trial_params['Nruns'], trial_params['Nrepetitions'])
+
+
+def example_trials(trial_params=CDA_generate_trials.BANK_CONDITIONS[0]):
+    """ The blocks of the first visit of a bank """
+    return CDA_generate_trials.make_trial_list(trial_params, SEED)[0]
+
+
+# Benchmarks. Each yields (name, times in seconds)
+
+def bench_spaced_xys(repeats):
+    for N in SET_SIZES:
+        yield 'spaced_xys[N=%i]' % N, measure(lambda: CDA_generate_trials.spaced_xys(N, -1), repeats)
+
+
+def bench_make_trial_list(repeats):
+    for trial_params in CDA_generate_trials.BANK_CONDITIONS:
+        yield ('make_trial_list[%s]' % trial_params_name(trial_params),
+               measure(lambda: CDA_generate_trials.make_trial_list(trial_params, SEED), max(1, repeats // 20)))
+
+
+def bench_prepare_trials(repeats):
+    import stimsoft_common
+    blocks = example_trials()
+    copy = lambda: ([[dict(trial) for trial in block] for block in blocks], )
+    yield 'prepare_trials', measure(lambda trial_list: stimsoft_common.prepare_trials(trial_list, START_INFO, 'CDA_rrLab', TRIGGERS_CUE), repeats, copy)
+
+
+def bench_stimuli(repeats):
+    """ What the experiment does for every trial during the ITI: Task.prepare_arrays and Task.compile_trial """
+    import tools.headless
+    import CDA_task  # after CDA_HEADLESS is set
+    trial_params = CDA_generate_trials.BANK_CONDITIONS[0]
+    trials = sum(example_trials(trial_params), [])
+    task = CDA_task.Task('experiment', CDA_sites.SITES[SITE]['language'], SITE, trial_params,
+                         filename=os.path.join(tempfile.mkdtemp(), 'benchmark.csv'))  # the event log and data file go there
+    durations = CDA_task.DURATIONS['experiment']
+
+    def setup_trial(trial):
+        task.prepare_arrays(trial)
+        return task.compile_trial(trial, durations)
+
+    rng = np.random.RandomState(SEED)
+    yield 'stimulus_setup', measure(setup_trial, repeats, lambda: (trials[rng.randint(len(trials))], ))
+
+    if tools.headless.HEADLESS:  # a real flip would wait for the screen
+        schedule = setup_trial(trials[0])
+        frames = [frame for frame in range(len(schedule)) if schedule.phases[frame] in ('array1', 'probe')]
+        yield 'play_frame', measure(lambda frame: schedule.play_frame(frame, task.frame_timer.flip, task.win.callOnFlip), repeats,
+                                    lambda: (frames[rng.randint(len(frames))], ))
+    task.writer.close()
+    task.events.close()
+    task.win.close()
+
+
+def bench_writers(repeats):
+    import stimsoft_common
+    trials = stimsoft_common.prepare_trials(example_trials(), START_INFO, 'CDA_rrLab', TRIGGERS_CUE)
+    for trial in trials:
+        trial.update({'trialId': 1, 'ans': 'same', 'rt': 0.5432, 'responseFrame': 32, 'response.corr': 1,
+                      'triggers': [[1, 1, 1.0, 1.02], [4, 37, 1.6, 1.62], [3, 103, 2.7, 2.72]]})
+        for key in ('itiUTC', 'arrowUTC', 'soaUTC', 'memoryArrayUTC', 'retentionUTC', 'testArrayUTC'):
+            trial[key] = '2016-04-06T09:56:13.123456Z'
+    trial_iter = iter(trials * (repeats // len(trials) + 1))
+    folder = tempfile.mkdtemp()
+
+    writer = stimsoft_common.csvWriter('write', folder, columns=stimsoft_common.TRIAL_COLUMNS)
+    yield 'csvWriter.write', measure(writer.write, repeats, lambda: (next(trial_iter), ))
+    writer = stimsoft_common.csvWriter('write_immediate', folder, columns=stimsoft_common.TRIAL_COLUMNS)
+    yield 'csvWriter._write_immediate', measure(writer._write_immediate, repeats, lambda: (next(trial_iter), ))
+    writer = stimsoft_common.BackgroundWriter('background', folder, columns=stimsoft_common.TRIAL_COLUMNS)
+    yield 'BackgroundWriter.write', measure(writer.write, repeats, lambda: (next(trial_iter), ))
+    writer.close()
+
+
+BENCHMARKS = {
+    'spaced_xys': bench_spaced_xys,
+    'make_trial_list': bench_make_trial_list,
+    'prepare_trials': bench_prepare_trials,
+    'stimuli': bench_stimuli,
+    'writers': bench_writers,
+}
+
+
+# History
+
+def git_commit():
+    """ Short hash of HEAD with '+' if the tree has changes. '' outside of git. """
+    folder = os.path.dirname(os.path.realpath(__file__))
+    try:
+        with open(os.devnull, 'w') as devnull:
+            commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=folder, stderr=devnull).decode().strip()
+            dirty = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=folder, stderr=devnull).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+    return commit + ('+' if dirty else '')
+
+
+def summarize(times):
+    times = np.array(times) * 1000
+    return {'n': len(times), 'median_ms': float(np.median(times)), 'p95_ms': float(np.percentile(times, 95)), 'max_ms': float(times.max())}
+
+
+def read_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as file_object:
+        return [json.loads(line) for line in file_object if line.strip()]
+
+
+def append_history(path, run):
+    with open(path, 'a') as file_object:
+        file_object.write(json.dumps(run, sort_keys=True) + '\n')
+
+
+def print_table(run, previous=None):
+    frame_ms = 1000 / FRAME_RATE
+    print('%-48s %10s %10s %10s %8s %10s' % ('benchmark', 'median ms', 'p95 ms', 'max ms', 'frames', 'vs. last'))
+    for name in sorted(run['results']):
+        result = run['results'][name]
+        change = ''
+        if previous and name in previous['results']:
+            change = '%+.0f%%' % (100 * (result['median_ms'] / previous['results'][name]['median_ms'] - 1))
+        print('%-48s %10.3f %10.3f %10.3f %8.3f %10s' % (name, result['median_ms'], result['p95_ms'], result['max_ms'],
+                                                         result['median_ms'] / frame_ms, change))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Time trial generation, trial preparation, stimulus setup and data writing.')
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help='run only these benchmarks')
+    parser.add_argument('--repeats', type=int, default=100, help='calls per benchmark (make_trial_list runs 1/20 of these)')
+    parser.add_argument('--display', action='store_true', help="real psychopy stimuli in the Task's full screen window instead of headless stand-ins")
+    parser.add_argument('--history', default=HISTORY_FILENAME, help='JSON lines file to append the results to')
+    parser.add_argument('--label', default='', help='free text saved with the run, e.g. what changed')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not args.display:
+        os.environ.setdefault('CDA_HEADLESS', 'fast')  # before stimsoft_common or tools.headless are imported
+    run = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'commit': git_commit(),
+        'label': args.label,
+        'host': socket.gethostname(),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'display': args.display,
+        'repeats': args.repeats,
+        'results': {}
+    }
+    for name in sorted(args.only or BENCHMARKS):
+        for result_name, times in BENCHMARKS[name](args.repeats):
+            run['results'][result_name] = summarize(times)
+
+    previous = [old for old in read_history(args.history) if old['host'] == run['host'] and old['display'] == run['display']]
+    append_history(args.history, run)
+    print_table(run, previous[-1] if previous else None)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,23 +1,25 @@
 from __future__ import division
-import itertools
-import random
-import math
 import numpy as np
 import os
 import json
+import argparse
+import multiprocessing
 
-from psychopy import core, gui
+import tools.layout
+import tools.trialbank
 
 # Field parameters
 MIN_DIST = 2.3  # cm
 FIELD_HEIGHT = 7.6  # cm from bottom to top
 FIELD_WIDTH = 4.8  # cm from center to extreme
 CENTER_DIST = 1.5  # distance from vertical centerline to closest possible rect
+FIELD = dict(min_dist=MIN_DIST, field_width=FIELD_WIDTH, field_height=FIELD_HEIGHT, center_dist=CENTER_DIST)
 
 # Rectangle parameters
 ORIS = (0, 45, 90, 135)  # truly randomly sampled with replacement during experiment
 TARGET_COLOR = 'red'
 DISTRACTOR_COLORS = ('blue', 'green')
+COLORS = (TARGET_COLOR, ) + DISTRACTOR_COLORS  # colour indices used in the trial arrays
 
 # Condition parameters (factorial design)
 PROBE_TYPES = ('same', 'change')
@@ -25,10 +27,21 @@ CUES = ['left', 'right']
 VISITS = 3
 
 TRIALS_FOLDERNAME = 'trials'
+GENERATOR_VERSION = 3  # increase whenever the same seed starts giving different trials
+DEFAULT_SEED = 2016  # seed of banks generated on demand, so every site gets the same banks
+TRIALS_FILENAME = 'T={Ntargets},D={Ndistractors},B={Nruns},R={Nrepetitions}.json'
+
+# Trial banks offered in the Condition field of the experiment dialogue
+BANK_CONDITIONS = [
+    {'Ntargets': (2, 3, 4), 'Ndistractors': (0, 2), 'Nruns': 5, 'Nrepetitions': 2},
+    {'Ntargets': (2, 3), 'Ndistractors': (0, 2), 'Nruns': 5, 'Nrepetitions': 3},
+    {'Ntargets': (3, 4), 'Ndistractors': (0, 2), 'Nruns': 5, 'Nrepetitions': 3},
+]
 
 # Functions
 
 def show_gui_dlg():
+    from psychopy import gui  # only needed for the dialogue, not in headless mode
     myDlg = gui.Dlg(title='Generate trials')
 
     myDlg.addField('Number of targets: ')
@@ -64,98 +77,292 @@ def show_gui_dlg():
 
 def spaced_xys(N, side):
     """ 
-    Brute force N coordinates until they meet the MIN_DIST criterion.
-    Reasonable combinations of N, MIN_DIST and FIELD_HEIGHT/WIDTH are required
-    for this to not go into infinite loops.
+    N coordinates that meet the MIN_DIST criterion, placed by tools.layout.
+    Raises ValueError if N items cannot fit in FIELD_HEIGHT/WIDTH.
     """
-    while True:
-        # list of (x,y) coordinates, rounded.
-        coords = [(round(random.uniform(CENTER_DIST, CENTER_DIST+FIELD_WIDTH)*side, 3),
-                   round(random.uniform(-FIELD_HEIGHT/2, FIELD_HEIGHT/2), 3))
-                   for i in range(N)]
-
-        # Loop through combinations and check if they are good
-        combinations = itertools.combinations(coords, 2)  # pairwise combinations
-        for c in combinations:
-            if math.sqrt((c[1][0] - c[0][0])**2 + (c[1][1]-c[0][1])**2) < MIN_DIST:  # pythagoras
-                break  # break for loop
-        else:  # if for loop wasn't broken (all coords are good)
-            return coords
-
-
-def make_trial_list(trial_params):
-    """ Make a list list of trials for the full experiment """
-    full_trial_list = []
-    for visit_day in range(VISITS):
-        current_day = []
-
-        # Loop through blocks and randomize within blocks
-        for block in range(trial_params['Nruns']):
-            current_block = []
-            
-            parameter_sets = itertools.product(range(trial_params['Nrepetitions']), trial_params['Ntargets'], trial_params['Ndistractors'], PROBE_TYPES, CUES)
-            
-            for repetition, n_targets, n_distractors, probe_type, cue in parameter_sets:
-                # index of targets. First left indices and then right indices
-                targets_left = random.sample(range(n_targets), n_targets)
-                targets_right = random.sample(range(n_targets+n_distractors, n_distractors + 2*n_targets), n_targets)
-
-                # calculate condition number
-                condition = 1 + \
-                                 (PROBE_TYPES.index(probe_type)==1)*1 + \
-                                 (CUES.index(cue)==1)*2 + \
-                                 (trial_params['Ndistractors'].index(n_distractors)==1)*4 + \
-                                 (trial_params['Ntargets'].index(n_targets)==1)*8
-
-                # Parameters of the trial type
-                trial = {}
-                trial['CueSide'] = cue
-                trial['block'] = block + 1
-                trial['numTargets'] = n_targets
-                trial['numDistracts'] = n_distractors
-                trial['Probe'] = probe_type
-                trial['Condition'] = condition
-                trial['ProbeCode'] = condition  # identical to as Condition. Delete?
-            
-                # Parameters of the rectangles
-                trial['xys'] = spaced_xys(n_targets + n_distractors, -1) + spaced_xys(n_targets + n_distractors, 1)
-                trial['oris'] = list(np.random.choice(ORIS, 2*(n_distractors+n_targets), replace=True))
-                trial['colors'] = [TARGET_COLOR if i in targets_left+targets_right else random.choice(DISTRACTOR_COLORS) for i in range(2*(n_targets+n_distractors))]
-                trial['targets'] = targets_left + targets_right
-                trial['probe_id'] = random.choice(targets_left) if cue is 'left' else random.choice(targets_right)
-                # Set probe orientation
-                if probe_type == 'change':
-                    trial['probe_ori'] = random.choice([ori for ori in ORIS if ori != trial['oris'][trial['probe_id']]])  # orientation if changed. choose a random non-current orientation for the probe
-                elif probe_type == 'same':
-                    trial['probe_ori'] = trial['oris'][trial['probe_id']]  # same orientation as before
-
-                current_block.append(trial)
-
-            # Randomize order and append to current day
-            random.shuffle(current_block)
-            current_day.append(current_block)
-                
-        full_trial_list.append(current_day)
-
-    return full_trial_list
+    return tools.layout.spaced_xys(N, side, **FIELD)
 
 
-if __name__ == '__main__':
-    # show GUI dialogue
-    trial_params = show_gui_dlg()
-    # if Cancel clicked -> quit
-    if trial_params is None:
-        core.quit()
-
-    # generate trials
-    trial_list = make_trial_list(trial_params)
-    
+def make_block_arrays(trial_params, block, rng=np.random):
+    """
+    Make one block of trials as a dict of NumPy arrays with one row per trial.
+
+    Scalar columns: 'block', 'CueSide' (index into CUES), 'Probe' (index into
+    PROBE_TYPES), 'numTargets', 'numDistracts', 'Condition', 'n_items',
+    'probe_id' and 'probe_ori'.
+    Item columns are padded to the largest set size: 'xys' (trials x items x 2,
+    NaN padded), 'oris', 'colors' (index into COLORS) and 'targets' (-1 padded).
+    Items are in the order of the trial dicts: first the left and then the
+    right items, each side starting with its targets.
+    """
+    Ntargets, Ndistractors = trial_params['Ntargets'], trial_params['Ndistractors']
+
+    # Factorial design in the order of itertools.product(repetitions, Ntargets, Ndistractors, PROBE_TYPES, CUES)
+    shape = (trial_params['Nrepetitions'], len(Ntargets), len(Ndistractors), len(PROBE_TYPES), len(CUES))
+    _, target_idx, distractor_idx, probe, cue = [idx.ravel() for idx in np.indices(shape)]
+    n_trials = len(cue)
+    n_targets = np.array(Ntargets)[target_idx]
+    n_side = n_targets + np.array(Ndistractors)[distractor_idx]  # items per side
+    condition = 1 + (probe == 1)*1 + (cue == 1)*2 + (distractor_idx == 1)*4 + (target_idx == 1)*8
+
+    # Item columns and masks of the valid entries
+    width = 2 * (max(Ntargets) + max(Ndistractors))
+    col = np.arange(width)
+    is_item = col < 2*n_side[:, None]
+    is_target = (col < n_targets[:, None]) | ((col >= n_side[:, None]) & (col < (n_side + n_targets)[:, None]))
+
+    # Parameters of the rectangles
+    xys = np.full((n_trials, width, 2), np.nan)
+    for size in np.unique(n_side):
+        rows = np.flatnonzero(n_side == size)
+        xys[rows, :size] = tools.layout.sample_layouts(len(rows), size, -1, rng, **FIELD)
+        xys[rows, size:2*size] = tools.layout.sample_layouts(len(rows), size, 1, rng, **FIELD)
+    ori_idx = rng.randint(0, len(ORIS), (n_trials, width))
+    oris = np.where(is_item, np.array(ORIS)[ori_idx], -1)
+    colors = np.where(is_target, 0, 1 + rng.randint(0, len(DISTRACTOR_COLORS), (n_trials, width)))
+    colors[~is_item] = -1
+
+    # Targets in random order. First left indices and then right indices
+    col_targets = np.arange(max(Ntargets))
+    valid = col_targets < n_targets[:, None]
+    order = np.argsort(np.where(valid[:, None], rng.random_sample((n_trials, 2, len(col_targets))), np.inf), axis=2)
+    col_targets = np.arange(2*len(col_targets))
+    targets = np.full((n_trials, len(col_targets)), -1)
+    targets[col_targets < n_targets[:, None]] = order[:, 0][valid]
+    targets[(col_targets >= n_targets[:, None]) & (col_targets < 2*n_targets[:, None])] = (order[:, 1] + n_side[:, None])[valid]
+
+    # Probe a random target on the cued side. Changed probes get a random non-current orientation
+    probe_id = (rng.random_sample(n_trials) * n_targets).astype(int) + (cue == 1)*n_side  # randint with an array bound needs numpy 1.17
+    probe_ori_idx = ori_idx[np.arange(n_trials), probe_id]
+    probe_ori_idx = np.where(probe == 1, (probe_ori_idx + rng.randint(1, len(ORIS), n_trials)) % len(ORIS), probe_ori_idx)
+
+    arrays = {
+        'block': np.full(n_trials, block + 1, dtype=int),
+        'CueSide': cue,
+        'Probe': probe,
+        'numTargets': n_targets,
+        'numDistracts': n_side - n_targets,
+        'Condition': condition,
+        'n_items': 2*n_side,
+        'xys': xys,
+        'oris': oris,
+        'colors': colors,
+        'targets': targets,
+        'probe_id': probe_id,
+        'probe_ori': np.array(ORIS)[probe_ori_idx]
+    }
+
+    # Randomize order within the block
+    order = rng.permutation(n_trials)
+    return dict((key, value[order]) for key, value in arrays.items())
+
+
+def make_visit_arrays(trial_params, rng=np.random):
+    """ All blocks of one visit as one dict of arrays. See make_block_arrays. """
+    blocks = [make_block_arrays(trial_params, block, rng) for block in range(trial_params['Nruns'])]
+    return dict((key, np.concatenate([arrays[key] for arrays in blocks])) for key in blocks[0])
+
+
+def arrays_to_trials(arrays):
+    """ Convert a dict of trial arrays (see make_block_arrays) to a list of trial dicts. """
+    columns = dict((key, value.tolist()) for key, value in arrays.items())
+    trials = []
+    for i in range(len(columns['Condition'])):
+        n_items = columns['n_items'][i]
+
+        # Parameters of the trial type
+        trial = {}
+        trial['CueSide'] = CUES[columns['CueSide'][i]]
+        trial['block'] = columns['block'][i]
+        trial['numTargets'] = columns['numTargets'][i]
+        trial['numDistracts'] = columns['numDistracts'][i]
+        trial['Probe'] = PROBE_TYPES[columns['Probe'][i]]
+        trial['Condition'] = columns['Condition'][i]
+        trial['ProbeCode'] = columns['Condition'][i]  # identical to as Condition. Delete?
+
+        # Parameters of the rectangles
+        trial['xys'] = [tuple(xy) for xy in columns['xys'][i][:n_items]]
+        trial['oris'] = columns['oris'][i][:n_items]
+        trial['colors'] = [COLORS[color] for color in columns['colors'][i][:n_items]]
+        trial['targets'] = columns['targets'][i][:2*trial['numTargets']]
+        trial['probe_id'] = columns['probe_id'][i]
+        trial['probe_ori'] = columns['probe_ori'][i]
+        trials.append(trial)
+    return trials
+
+
+def trial_cell(trial):
+    """
+    The design cell of a trial dict: (Condition, numTargets). The Condition
+    code alone does not tell the first from the third number of targets.
+    """
+    return trial['Condition'], trial['numTargets']
+
+
+class ReservePool(object):
+    """
+    Spare trials of every cell of trial_params (its 'Ntargets' and
+    'Ndistractors'), made by make_block_arrays like the trials of a bank, e.g.
+    to replace rejected trials. pop(cell) makes another block of spares when
+    the cell has run out.
+    """
+    def __init__(self, trial_params, repetitions=1, rng=np.random):
+        self.trial_params = {'Ntargets': trial_params['Ntargets'], 'Ndistractors': trial_params['Ndistractors'],
+                             'Nrepetitions': repetitions}
+        self.rng = rng
+        self.trials = {}
+        self.refill()
+
+    def refill(self):
+        for trial in arrays_to_trials(make_block_arrays(self.trial_params, 0, self.rng)):
+            self.trials.setdefault(trial_cell(trial), []).append(trial)
+
+    def pop(self, cell):
+        """ A spare trial of cell (see trial_cell) """
+        if not self.trials.get(cell):
+            self.refill()
+        return self.trials[cell].pop()
+
+
+def block_rng(seed, visit_day, block):
+    """ Independent random stream for one block of one visit, derived from the master seed. """
+    return np.random.RandomState([seed, visit_day, block])
+
+
+def _make_block(job):
+    """ Worker for make_trial_list. Module level so that it can be pickled to a process pool. """
+    trial_params, seed, visit_day, block = job
+    return arrays_to_trials(make_block_arrays(trial_params, block, block_rng(seed, visit_day, block)))
+
+
+def make_trial_list(trial_params, seed=None, processes=1):
+    """
+    Make a list list of trials for the full experiment.
+    Every block of every visit is generated from its own stream seeded with
+    (seed, visit, block), so the result only depends on the seed and not on
+    the number of processes. A seed is drawn if none is given.
+    """
+    if seed is None:
+        seed = np.random.randint(2**31)
+    return group_visits(run_jobs(_make_block, bank_jobs(trial_params, seed), processes), trial_params)
+
+
+def bank_jobs(trial_params, seed):
+    """ One job per visit and block, in the order of the trial list. """
+    return [(trial_params, seed, visit_day, block) for visit_day in range(VISITS) for block in range(trial_params['Nruns'])]
+
+
+def group_visits(blocks, trial_params):
+    """ Split the blocks of bank_jobs into a list of visits. """
+    return [blocks[visit_day*trial_params['Nruns']:(visit_day+1)*trial_params['Nruns']] for visit_day in range(VISITS)]
+
+
+def run_jobs(function, jobs, processes=1):
+    """ map function over jobs, in a process pool if processes > 1. Results are in the order of jobs. """
+    if processes <= 1:
+        return [function(job) for job in jobs]
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(function, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def save_trial_list(trial_list, trial_params, seed, folder=TRIALS_FOLDERNAME):
+    """
+    Store trials as JSON in folder and register the binary bank in the folder's index.
+    Keys are sorted so the same trials always give the same bytes.
+    """
     # check whether trials folder exists
-    if not os.path.isdir(TRIALS_FOLDERNAME):
-        os.makedirs(TRIALS_FOLDERNAME)
-        
-    # prepare filename
-    filename = 'T={Ntargets},D={Ndistractors},B={Nruns},R={Nrepetitions}.json'.format(**trial_params)
-    # store trials
-    with open(os.path.join(TRIALS_FOLDERNAME, filename), 'w') as f:
-        json.dump(trial_list, f)
\ No newline at end of file
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    filename = os.path.join(folder, TRIALS_FILENAME.format(**trial_params))
+    with open(filename, 'w') as f:
+        json.dump(trial_list, f, sort_keys=True)
+    tools.trialbank.BankIndex(folder).add(bank_key(trial_params, seed), trial_list)
+    return filename
+
+
+def bank_key(trial_params, seed=DEFAULT_SEED):
+    """ Key of a bank in tools.trialbank.BankIndex """
+    return tools.trialbank.BankIndex.key(trial_params['Ntargets'], trial_params['Ndistractors'], trial_params['Nruns'],
+                                         trial_params['Nrepetitions'], seed, GENERATOR_VERSION)
+
+
+def request_bank(bank_index, trial_params, seed=DEFAULT_SEED):
+    """
+    Start generating a bank in the background unless it is indexed or an older
+    JSON file for these parameters exists.
+    """
+    if not os.path.isfile(os.path.join(bank_index.folder, TRIALS_FILENAME.format(**trial_params))):
+        bank_index.prefetch(bank_key(trial_params, seed), lambda: make_trial_list(trial_params, seed))
+
+
+def load_bank(bank_index, trial_params, seed=DEFAULT_SEED):
+    """
+    TrialBank for trial_params: from the index, from an older JSON file or
+    generated on demand (waiting for request_bank if it is still running).
+    """
+    key = bank_key(trial_params, seed)
+    if key in bank_index:
+        return bank_index.get(key)
+    bank = tools.trialbank.open_trials(os.path.join(bank_index.folder, TRIALS_FILENAME.format(**trial_params)))
+    if bank is None:
+        request_bank(bank_index, trial_params, seed)
+        bank = bank_index.wait(key)
+    return bank
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Generate trial banks. Shows a dialogue if no bank is specified.')
+    parser.add_argument('--all', action='store_true', help='generate every bank offered in the experiment dialogue')
+    parser.add_argument('-T', '--targets', help='numbers of targets, e.g. 2,3')
+    parser.add_argument('-D', '--distractors', default='0,2', help='numbers of distractors, e.g. 0,2')
+    parser.add_argument('-B', '--blocks', type=int, default=5, help='number of blocks')
+    parser.add_argument('-R', '--repetitions', type=int, default=3, help='number of repetitions')
+    parser.add_argument('--seed', type=int, help='master seed. Drawn and printed if not given')
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(), help='size of the process pool')
+    parser.add_argument('--folder', default=TRIALS_FOLDERNAME, help='output folder')
+    return parser.parse_args()
+
+
+def main_headless(args):
+    """ Generate the requested banks with all their blocks spread over one process pool. """
+    if args.all:
+        banks = BANK_CONDITIONS
+    else:
+        banks = [{
+            'Ntargets': tuple(int(n) for n in args.targets.split(',')),
+            'Ndistractors': tuple(int(n) for n in args.distractors.split(',')),
+            'Nruns': args.blocks,
+            'Nrepetitions': args.repetitions
+        }]
+    seed = np.random.randint(2**31) if args.seed is None else args.seed
+    print('master seed: %i' % seed)
+
+    jobs = sum([bank_jobs(trial_params, seed) for trial_params in banks], [])
+    blocks = run_jobs(_make_block, jobs, args.processes)
+
+    for trial_params in banks:
+        n_blocks = VISITS * trial_params['Nruns']
+        bank_blocks, blocks = blocks[:n_blocks], blocks[n_blocks:]
+        print('wrote %s' % save_trial_list(group_visits(bank_blocks, trial_params), trial_params, seed, args.folder))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.all or args.targets:
+        main_headless(args)
+    else:
+        # show GUI dialogue
+        trial_params = show_gui_dlg()
+        # if Cancel clicked -> quit
+        if trial_params is None:
+            from psychopy import core
+            core.quit()
+
+        # generate and store trials
+        seed = np.random.randint(2**31)
+        save_trial_list(make_trial_list(trial_params, seed), trial_params, seed)
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Language packs of the CDA task (see CDA_task.py): every text shown to the
+subject or experimenter, and the pictures which contain text.
+
+:intro_phases: instructions shown on the first frame of these phases of the
+    paced practice trial.
+:practice: instructions before the paced, the self-paced and the timed practice.
+:evaluation: last line of the experimenter's feedback after the timed practice.
+:response_pad: picture of the response buttons.
+:practice_instruct_pos: position of the instructions in the practice. The
+    English texts are longer and start higher.
+"""
+
+LANGUAGES = {
+    'en': {
+        'continue': u'Press the mouse to continue...',
+        'experiment': u'We will begin the task now.',
+        'break': u'You are now allowed to take up to three minutes break.',
+        'finish': u'You have completed this task now!',
+        'intro': u'Welcome In this experiment, we will test your ability to hold a number of shapes in working memory. The experiment is broken into trials. The cartoon below illustrates the scenes you will see on each trial. Always keep your eyes fixed on the black dot in the center of the screen.',
+        'intro_phases': {
+            'ITI': u'Each trial will begin with a blank screen. During this time, keep your eyes fixed on the black dot, shown below.',
+            'cue': u'Next, an arrow will appear.  If the arrow is pointing left, pay attention to the left side of the screen for the rest of the trial.  If the arrow is pointing to the right, pay attention to the right side of the screen. Again, during this time, keep your eyes fixed on the black dot in the center of the screen.',
+            'array1': u'Next, you will see a number of colored rectangles. Some of them will be red. Others may be blue or green. Only pay attention to the red rectangles, on the side of the screen that the arrow indicated. Again, during this time, keep your eyes fixed on the black dot in the center of the screen.',
+            'retention': u'After the shapes disappear, remember the orientation of the red rectangles that you just saw. Only remember the red rectangles on the side of the screen that the arrow indicated.  Again, during this time, keep your eyes fixed on the black dot in the center of the screen and try not to blink.',
+            'probe': u'Finally, 2 rectangles will appear again (one on each side of the screen).  Evaluate the rectangle on the side of the screen that the arrow indicated.  If it has changed orientation, press the green button.  If it is the same orientation as it was in the scene you saw earlier, press the black button.',
+        },
+        'practice': (
+            u"""Lets practice.  Remember the following:
+* Keep your eyes fixed on black dot in the center of the screen
+* Pay attention only to the side indicted by the arrow
+* Remember the orientation of the red blocks only
+* Press the left mouse button if they change
+* Press the right mouse button if they stay in the same orientation""",
+            u"""Now let's try some practice trials. At the end of each trial, we'll pause and discuss the correct response for that trial.
+
+Ready?""",
+            u"""Now let's try some actual practice trials using the speed at which the experiment will run.
+
+Ready?""",
+        ),
+        'evaluation': u'Press "R" to repeat or "C" to continue...',
+        'response_pad': 'intros/buttons-eng.jpg',
+        'practice_instruct_pos': (0, 6),
+    },
+    'sk': {
+        'continue': u'Pokračujte stlačením myši ...',
+        'experiment': u'Teraz môžeme začať úlohu.',
+        'break': u'Teraz si môžete tri minúty oddýchnuť.',
+        'finish': u'Teraz ste úlohu dokončili!',
+        'intro': u'Vitajte! V tomto experimente budeme testovať vašu schopnosť udržať niekoľko objektov v pracovnej pamäti. Experiment je zložený z viacerých pokusov. Na obrázku je znázornený priebeh jedného pokusu. Pohľad majte stále upretý na čiernu bodku v strede obrazovky! ',
+        'intro_phases': {
+            'ITI': u'Každý pokus začne prázdnou obrazovkou. Zrak nechajte upretý na čiernej bodke zobrazenej nižšie. ',
+            'cue': u'Ďalej sa zobrazí šípka. Ak šípka smeruje doľava, počas tohto pokusu zamerajte pozornosť na ľavú stranu obrazovky. Ak šípka smeruje doprava, zamerajte pozornosť na pravú stranu obrazovky. Opäť, počas celej doby držte pohľad uprený pevne na čiernej bodke v strede obrazovky! ',
+            'array1': u'Ďalej uvidíte niekoľko farebných obdĺžnikov. Niektoré z nich budú červené. Ostatné môžu byť modré alebo zelené. Pozornosť venujte iba červeným obdĺžnikom, len na strane obrazovky, ktorú naznačila šípka. Opäť, počas tejto doby držte pohľad pevne na čiernej bodke v strede obrazovky! ',
+            'retention': u'Po zmiznutí útvarov si udržte v pamäti orientáciu červených obdĺžnikov, ktoré ste práve videli. Sústreďte sa iba na červené obdĺžniky na tej strane obrazovky, ktorú naznačila šípka. Opäť, počas tejto doby držte oči pevne upreté na čiernej bodke v strede obrazovky a pokúste sa nežmurkať! ',
+            'probe': u'Nakoniec sa objavia dva obdĺžniky (jeden na každej strane obrazovky). Vyhodnoťte obdĺžnik na tej strane obrazovky, ktorú označuje šípka. Ak sa zmenila jeho orientácia, stlačte zelené (ľavé) tlačidlo. Ak je jeho orientácia rovnaká ako v predchádzajúcej scéne, stlačte červené (pravé) tlačidlo. ',
+        },
+        'practice': (
+            u"""Poďme si to precvičiť. Nezabudnite:
+* Pohľad držte upretý na čiernej bodke v strede obrazovky
+* Pozornosť zamerajte na stranu naznačenú šípkou
+* Zapamätajte si len orientáciu červených obdĺžnikov
+* Stlačte zelené tlačidlo, ak sa orientácia zmenila
+* Stlačte červené tlačidlo, ak orientácia zostala rovnaká """,
+            u"""Teraz skúsme niekoľko zácvičných pokusov. Na konci každého pokusu sa pozastavíme a preberieme si správnu odpoveď.
+
+Môžeme?""",
+            u"""Teraz skúsme niekoľko zácvičných pokusov s použitím rýchlosti, akou bude experiment naozaj bežať.
+
+Môžeme?""",
+        ),
+        'evaluation': u'Stlačte "R" na zopakovanie alebo "C" na pokračovanie...',
+        'response_pad': 'intros/buttons-sk.jpg',
+        'practice_instruct_pos': (0, 5),
+    },
+}
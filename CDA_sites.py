@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Site profiles of the CDA task (see CDA_task.py): the monitors, the trigger
+table, the response device and the experiment dialogue of a lab.
+
+:monitors: monitor of the experiment and of the practice. distance and width
+    in cm, size in pixels.
+:color: background in rgb255.
+:triggers: Dig-I/O-2 channels (see stimsoft_common.lpt_code) to send on the
+    cue onset per arrow direction (1 is left), on the memory array per probe
+    type and on the probe onset. cue_codes are saved as CueCode.
+:response_device: key of CDA_task.RESPONSE_DEVICES.
+:dialogue: 'banks' to choose one of the generated trial banks or
+    'parameters' to enter the numbers of targets, distractors etc.
+:practice_repetitions: trials of the timed practice per number of targets
+    and distractors.
+:language: key of CDA_languages.LANGUAGES used if none is given at launch.
+:eog: None, or the EOG stream to monitor during the experiment (see
+    eog_monitor.py), e.g. {'stream': 'tcp://localhost:5001', 'fs': 256,
+    'n_channels': 4, 'channels': (2, 3), 'thresholds': 'thresholds.txt',
+    'requeue': 1}. Trials are saved with eog_saccade and eog_blink and
+    rejected trials are replaced by fresh trials of their Condition at the
+    end of their block, up to requeue times the planned trials of a Condition.
+"""
+
+TRIGGERS = {
+    'cue': {1: (5, ), -1: (6, )},  # arrow direction
+    'probe': {'same': (7, ), 'change': (8, )},  # probe type
+    'test_array': (5, 6),  # was (5, 6, 7, 8)
+    'cue_codes': {'left': 22, 'right': 21}  # swapped compared to original
+}
+
+PRACTICE_MONITOR = {'distance': 70, 'width': 34.7, 'size': [1360, 768]}
+
+SITES = {
+    'rrlab': {
+        'monitors': {
+            'experiment': {'distance': 75, 'width': 59.5, 'size': [2560, 1440]},  # width was 34.7
+            'practice': PRACTICE_MONITOR
+        },
+        'color': (150, 150, 150),  # background 255,255,255 white 0,0,0 black
+        'triggers': TRIGGERS,
+        'response_device': 'mouse',
+        'dialogue': 'banks',
+        'practice_repetitions': 8,
+        'language': 'en',
+        'eog': None
+    },
+    'rrlab_sk': {
+        'monitors': {
+            'experiment': {'distance': 70, 'width': 59.5, 'size': [2560, 1440]},
+            'practice': PRACTICE_MONITOR
+        },
+        'color': (150, 150, 150),
+        'triggers': TRIGGERS,
+        'response_device': 'mouse',
+        'dialogue': 'parameters',
+        'practice_repetitions': 3,  # orig 8
+        'language': 'sk',
+        'eog': None
+    },
+}
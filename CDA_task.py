@@ -0,0 +1,700 @@
+# encoding: utf-8
+
+"""
+The task engine. Every variant of the task is a task ('experiment' or
+'practice') run in a language (CDA_languages.py) at a site (CDA_sites.py,
+monitors, triggers, response device and dialogue). The CDA_final_experiment_*
+and CDA_practice* scripts just launch their variant.
+
+The experiment shows the site's dialogue, reads the chosen trials (see
+CDA_generate_trials.py) and runs them in blocks with breaks. The practice
+runs the introduction: a trial paced phase by phase with the instructions
+of the language, self-paced trials and timed practice trials until the
+experimenter continues.
+
+Every trial is compiled to a frame schedule (tools/schedule.py) while the
+previous one is shown, so phases are timed in frames of the monitor rather
+than in milliseconds and without jitter. Triggers are sent on the flips
+they belong to. Each trial is saved as soon as it ends with its UTC onsets,
+the actual duration of every phase and, if the site monitors the EOG, its
+saccades and blinks.
+
+Usage:
+    python CDA_task.py --task experiment --site rrlab
+    python CDA_task.py --task practice --language sk --site rrlab_sk
+"""
+
+
+from __future__ import division
+import time
+import os
+import argparse
+import itertools
+import collections
+import numpy as np
+
+# Setting up psychopy stuff. The Window, stimuli and dialogue are only imported
+# when they are needed (see Task), so that this module imports quickly.
+import tools.headless
+from psychopy import core
+from stimsoft_common import (waitMousePressed, getMousePressed, EventLog, event, get_start_info, prepare_trials, FrameTimer,
+                             ResponseCapture, TriggerScheduler, lpt_code, BackgroundWriter, Background, TRIAL_COLUMNS)
+
+import tools.schedule
+import tools.trialbank
+import CDA_generate_trials
+import eog_monitor
+from CDA_languages import LANGUAGES
+from CDA_sites import SITES
+
+
+TASKS = ('experiment', 'practice')
+EXP_IDENTIFIERS = {'experiment': 'CDA_rrLab', 'practice': 'Contralateral_Delay_Activity_v9-0'}
+
+# Mapping from buttons to meaning and keys to continue here and there. 'cedrus_bits' will be added later
+RESPONSE_DEVICES = {
+    'mouse': {'answers': {0: 'change', 2: 'same'}, 'advance': [0]},
+    'cedrus_keyboard': {'answers': {'left': 'change', 'right': 'same'}, 'advance': ['left']}
+}
+
+# Durations (number of frames)
+DURATIONS = {
+    'experiment': {
+        'cue': 12,
+        'SOA': 12,
+        'array1': 12,
+        'retention': 54,
+        'probe': 180,
+        'ITI': 45
+    },
+    'practice': {
+        'cue': 12,
+        'SOA': 12,
+        'array1': 12,
+        'retention': 36,
+        'probe': 120,
+        'ITI': 45
+    }
+}
+
+# Practice trials (factorial design)
+PRACTICE_PARAMS = {'Ntargets': (1, 3), 'Ndistractors': (0, 2), 'Nruns': 1}
+PRACTICE_CONDITIONS = [2, 4, 5, 6, 13, 16]  # condition indices of the paced practice trials
+PRACTICE_COLUMNS = ('exp_phase', 'no_total', 'response_device', 'EventCode', 'StartBarcodeUTC')  # saved in addition to TRIAL_COLUMNS
+
+# Rectangle parameters
+RECT_SIZE = (1.5, 0.5)  # in cm
+PROBE_AFTER_RESPONSE = True  # keep the probe array on screen after a response until the probe phase ends
+
+# Online EOG monitor (the site's 'eog')
+EOG_WINDOW = ('arrowUTC', 'testArrayUTC')  # a saccade or blink from the cue to the probe onset rejects the trial
+EOG_COLUMNS = ('eog_saccade', 'eog_blink', 'replacement')  # saved in addition if the EOG is monitored. replacement is 1 for trials from the reserve
+
+# Other stuff
+ARROW_SHAFT_WIDTH = 0.25 # cm
+ARROW_POINT_BASE = 3.0 # cm
+ARROW_SIZE = 2 # Some scalar value that works.
+FIX_RADUS = 0.15  # cm
+KEYS_QUIT = ['escape']
+
+INSTRUCTION_RESPONSE_START = 2  # minimum number of seconds before accepting responses
+
+# Trial banks to choose from in the 'banks' dialogue
+CONDITIONS = ['CDT: t={2,3,4} b=5 r=2', 'CDA: t={2,3} b=5 r=3', 'CDA: t={3,4} b=5 r=3']
+BANK_DISTRACTORS = (0, 2)
+
+ARROW_VERTICES = np.array((
+    # Start at the tip in a counter-clockwise direction.
+    (-0.5 * ARROW_POINT_BASE, 0),
+    (-0.25 * ARROW_POINT_BASE, ARROW_SIZE * ARROW_SHAFT_WIDTH),
+    (-0.25 * ARROW_POINT_BASE, 0.5 * ARROW_SHAFT_WIDTH),
+    (0.5 * ARROW_POINT_BASE, 0.5 * ARROW_SHAFT_WIDTH),
+    (0.5 * ARROW_POINT_BASE, -0.5 * ARROW_SHAFT_WIDTH),
+    (-0.25 * ARROW_POINT_BASE, -0.5 * ARROW_SHAFT_WIDTH),
+    (-0.25 * ARROW_POINT_BASE, -ARROW_SIZE * ARROW_SHAFT_WIDTH),
+    (-0.5 * ARROW_POINT_BASE, 0)
+    ))
+
+
+# Dialogues
+
+def parse_condition(choice):
+    """ Split a condition choice such as 'CDA: t={2,3} b=5 r=3' into (cond, Ntargets, Nblocks, Nrepetitions) """
+    cond, Ntargets, Nblocks, Nrepetitions = choice.split(' ')
+    cond = cond[:-1]  # remove ':' from end
+
+    Ntargets = tuple(eval(Ntargets[3:-1]))
+    Nblocks = int(Nblocks[2:])
+    Nrepetitions = int(Nrepetitions[2:])
+    return cond, Ntargets, Nblocks, Nrepetitions
+
+
+def show_bank_dlg(trials_foldername='trials'):
+    """ Subject data and one of the CONDITIONS. Returns (experiment_params, subject_data, filename, trials) or None if cancelled. """
+    # Generate missing trial banks in the background while the dialogue is filled in
+    bank_index = tools.trialbank.BankIndex(trials_foldername)
+    for choice in CONDITIONS:
+        cond, Ntargets, Nblocks, Nrepetitions = parse_condition(choice)
+        CDA_generate_trials.request_bank(bank_index, {'Ntargets': Ntargets, 'Ndistractors': BANK_DISTRACTORS,
+                                                      'Nruns': Nblocks, 'Nrepetitions': Nrepetitions})
+
+    gui = tools.headless.psychopy_module('gui')  # only needed for the dialogue
+    myDlg = gui.Dlg(title='Experiment parameters')
+
+    myDlg.addText('Subject data', color='purple')
+
+    myDlg.addField('Subject initials (XX): ')
+    myDlg.addField('Subject ID (XX): ')
+    myDlg.addField('Condition: ', choices=CONDITIONS)
+    myDlg.addField('TimePoint number: ')
+    myDlg.addField('Cohort number (xx): ')
+    myDlg.addField('Location: ', choices=['KE', 'BA'])
+    myDlg.addField('Dataset version: ', choices=['1', '2', '3'])
+
+    while True:
+        data = myDlg.show()
+        if myDlg.OK:
+            cond, Ntargets, Nblocks, Nrepetitions = parse_condition(data[2])
+            Ndistractors = BANK_DISTRACTORS
+
+            if '' not in data:
+                # attempt to find stored results
+                experiment_params = {
+                    'Ntargets': Ntargets,
+                    'Ndistractors': Ndistractors,
+                    'Nblocks': Nblocks,
+                    'Nrepetitions': Nrepetitions
+                }
+                trial_bank = CDA_generate_trials.load_bank(bank_index, {'Ntargets': Ntargets, 'Ndistractors': Ndistractors,
+                                                                        'Nruns': Nblocks, 'Nrepetitions': Nrepetitions})
+                if trial_bank is None:
+                    gui.warnDlg(prompt='Please generate trials first')
+                    continue
+
+                dataset_idx = int(data[6]) - 1
+                if dataset_idx < 0 or dataset_idx >= len(trial_bank):
+                    gui.warnDlg(prompt='ERROR: Trials file does not have required dataset version')
+                    continue
+                trials = Background(trial_bank.__getitem__, dataset_idx)  # read the visit while the Window opens
+                break
+            else:
+                gui.warnDlg(prompt='ERROR: some fields are not filled!')
+        else:
+            return None
+
+    subject_data = {
+        'SubInt': data[0],
+        'SubID': data[1],
+        'Cond': cond,
+        'TPnum': data[3],
+        'Cohort': data[4],
+        'Location': data[5],
+        'Dataset': data[6],
+        'current_time':  time.strftime('%d-%m-%Y %H-%M-%S')
+    }
+
+    filename = "{SubInt} {SubID} {Cond} {TPnum} C{Cohort}-L{Location}-D{Dataset} {current_time}.csv".format(**subject_data)
+
+    return experiment_params, subject_data, filename, trials
+
+
+def show_parameter_dlg(trials_foldername='trials'):
+    """ Subject data and the numbers of targets, distractors etc. Returns (experiment_params, subject_data, filename, trials) or None if cancelled. """
+    gui = tools.headless.psychopy_module('gui')  # only needed for the dialogue
+    myDlg = gui.Dlg(title='Experiment parameters')
+
+    myDlg.addText('Subject data', color='purple')
+
+    myDlg.addField('Subject initials (XX): ')
+    myDlg.addField('Subject ID (XX): ')
+    myDlg.addField('Condition: ', choices=['CDT', 'CDA','CAVE', 'EC', 'EO'])
+    myDlg.addField('TimePoint type: ', choices=['preTRAIN', 'postTRAIN'])
+    myDlg.addField('TimePoint number: ')
+    myDlg.addField('Cohort number (xx): ')
+    myDlg.addField('Location: ', choices=['KE', 'BA'])
+    myDlg.addField('Visit number: ')
+
+    myDlg.addText('Experiment parameters', color='purple')
+
+    myDlg.addField('Number of targets: ')
+    myDlg.addField('Number of distractors: ')
+    myDlg.addField('Number of blocks: ')
+    myDlg.addField('Number of repetitions: ')
+
+    while True:
+        data = myDlg.show()
+        if myDlg.OK:
+            try:
+                Ntargets = tuple(eval(data[8] + ','))
+                Ndistractors = tuple(eval(data[9] + ','))
+                Nruns = int(data[10])
+                Nrepetitions = int(data[11])
+            except (ValueError, NameError, SyntaxError) as e:
+                gui.warnDlg(prompt='ERROR: incorrect value')
+                continue
+
+            if '' not in data:
+                # attempt to find stored results
+                experiment_params = {
+                    'Ntargets': Ntargets,
+                    'Ndistractors': Ndistractors,
+                    'Nruns': Nruns,
+                    'Nrepetitions': Nrepetitions
+                }
+                # memory-mapped, only the selected visit is read. Generated on demand if missing
+                trial_bank = CDA_generate_trials.load_bank(tools.trialbank.BankIndex(trials_foldername), experiment_params)
+                if trial_bank is None:
+                    gui.warnDlg(prompt='Please generate trials first')
+                    continue
+
+                visit_day_idx = int(data[7]) - 1
+                if visit_day_idx < 0 or visit_day_idx >= len(trial_bank):
+                    gui.warnDlg(prompt='ERROR: Trials file does not have required day of visit')
+                    continue
+                trials = Background(trial_bank.__getitem__, visit_day_idx)  # read the visit while the Window opens
+                break
+            else:
+                gui.warnDlg(prompt='ERROR: some fields are not filled!')
+        else:
+            return None
+
+    subject_data = {
+        'SubInt': data[0],
+        'SubID': data[1],
+        'Cond': data[2],
+        'TPtype': data[3],
+        'TPnum': data[4],
+        'Cohort': data[5],
+        'Location': data[6],
+        'Visit': data[7],
+        'current_time':  time.strftime('%d-%m-%Y %H-%M-%S')
+    }
+
+    filename = "{SubInt} {SubID} {Cond} {TPtype}{TPnum} C{Cohort}-L{Location}-D{Visit} {current_time}.csv".format(**subject_data)
+
+    return experiment_params, subject_data, filename, trials
+
+
+DIALOGUES = {'banks': show_bank_dlg, 'parameters': show_parameter_dlg}
+
+
+# Practice trials
+
+def make_practice_trials(repetitions, rng=np.random):
+    """
+    One block with repetitions trials of every number of targets and
+    distractors in PRACTICE_PARAMS. Probe type and cue are random.
+    """
+    trial_params = dict(PRACTICE_PARAMS, Nrepetitions=repetitions)
+    trials = CDA_generate_trials.arrays_to_trials(CDA_generate_trials.make_block_arrays(trial_params, 0, rng))  # also factorial over probe types and cues
+    block = []
+    for n_targets, n_distractors in itertools.product(PRACTICE_PARAMS['Ntargets'], PRACTICE_PARAMS['Ndistractors']):
+        cell = [trial for trial in trials if trial['numTargets'] == n_targets and trial['numDistracts'] == n_distractors]
+        block += cell[:repetitions]  # the block is in random order, so these have random probe types and cues
+    return [block]
+
+
+def make_intro_trials(rng=np.random):
+    """ One block with a trial of each of PRACTICE_CONDITIONS, in that order """
+    trial_params = dict(PRACTICE_PARAMS, Nrepetitions=1)
+    trials = CDA_generate_trials.arrays_to_trials(CDA_generate_trials.make_block_arrays(trial_params, 0, rng))
+    by_condition = dict((trial['Condition'], trial) for trial in trials)
+    return [[by_condition[condition] for condition in PRACTICE_CONDITIONS]]
+
+
+class TrialScheduler(object):
+    """
+    The trials of a run_block with the valid ones counted per cell
+    (CDA_generate_trials.trial_cell, the Condition and number of targets).
+    At the end of every block, the cells with fewer valid trials than were
+    planned so far get fresh trials of the same cell from reserve (a
+    CDA_generate_trials.ReservePool), in random order. A cell gets at most
+    max_extra times its planned trials from the reserve in total.
+
+    Usage:
+        scheduler = TrialScheduler(trial_list, reserve, max_extra=1)
+        trials = scheduler.trials  # grows when end_block inserts replacements
+        scheduler.record(trial, valid)  # after every trial
+        scheduler.end_block(position)  # after the last trial of every block
+    """
+    def __init__(self, trials, reserve=None, max_extra=0):
+        self.trials = list(trials)
+        self.reserve = reserve
+        self.max_extra = max_extra
+        self.planned = collections.Counter(CDA_generate_trials.trial_cell(trial) for trial in self.trials)
+        self.due = collections.Counter()  # planned trials played
+        self.valid = collections.Counter()
+        self.added = collections.Counter()  # replacements
+        self.last = {}  # last trial of every cell. Replacements keep its session info and CueCode
+
+    def record(self, trial, valid):
+        """ Count a played trial """
+        cell = CDA_generate_trials.trial_cell(trial)
+        self.due[cell] += not trial.get('replacement')
+        self.valid[cell] += bool(valid)
+        self.last[cell] = trial
+
+    def end_block(self, position):
+        """ Insert the replacements for the block which ended before position. Returns how many. """
+        if self.reserve is None:
+            return 0
+        block_end = self.trials[position - 1]
+        replacements = []
+        for cell in sorted(self.due):
+            n = min(self.due[cell] - self.valid[cell], self.max_extra*self.planned[cell] - self.added[cell])
+            for _ in range(max(n, 0)):
+                replacement = dict(self.last[cell], **self.reserve.pop(cell))
+                replacement.update(block=block_end['block'], replacement=1)
+                replacements.append(replacement)
+                self.added[cell] += 1
+        self.reserve.rng.shuffle(replacements)
+        for no, replacement in enumerate(replacements, block_end['no_block'] + 1):
+            replacement['no_block'] = no
+        self.trials[position:position] = replacements
+        return len(replacements)
+
+    def missing(self):
+        """ Dict of the cells with fewer valid trials than planned to the number missing """
+        return dict((cell, self.planned[cell] - self.valid[cell]) for cell in self.planned if self.valid[cell] < self.planned[cell])
+
+
+class Task(object):
+    """
+    The Window, stimuli and recorders of one session of task ('experiment' or
+    'practice') in language at site (keys of LANGUAGES and SITES). Nothing is
+    opened before this is created, so the module can be imported for reuse.
+    """
+    def __init__(self, task, language, site, trial_params, subject_data=None, filename=None):
+        """
+        :trial_params: dict with the 'Ntargets' and 'Ndistractors' of the trials. Sizes the rectangle arrays.
+        :subject_data: dict from the dialogue or None. Its 'SubInt' and 'SubID' are saved as participant.
+        :filename: name of the csv in the results folder. If None, the results folder name plus '.csv'.
+        """
+        visual = tools.headless.psychopy_module('visual')  # takes a while to import, so only when needed
+        if tools.headless.HEADLESS:
+            from tools.headless import RectArray, BarcodePulse
+        else:
+            from tools.stimarray import RectArray
+            from tools.barcode import BarcodePulse
+
+        self.task = task
+        self.texts = LANGUAGES[language]
+        self.site = SITES[site]
+        self.device = self.site['response_device']
+        self.keys_ans = dict(RESPONSE_DEVICES[self.device]['answers'])
+        self.keys_ans[None] = 'none'
+        self.answer_keys = tuple(RESPONSE_DEVICES[self.device]['answers'])
+        self.keys_advance = RESPONSE_DEVICES[self.device]['advance']
+
+        monitor = self.site['monitors'][task]
+        my_monitor = tools.headless.psychopy_module('monitors').Monitor('testMonitor', width=monitor['width'], distance=monitor['distance'])  # Create monitor object from the variables above. This is needed to control size of stimuli in degrees.
+        my_monitor.setSizePix(monitor['size'])
+        self.win = win = visual.Window(monitor=my_monitor, screen=0, units='cm', color=self.site['color'], colorSpace='rgb255', fullscr=True, allowGUI=False)  # Initiate psychopy Window as the object "win", using the myMon object from last line. Use degree as units!
+        self.barcode = BarcodePulse(win)
+
+        n_max = 2*(max(trial_params['Ntargets']) + max(trial_params['Ndistractors']))
+        self.memory_array = RectArray(win, RECT_SIZE, n_max)
+        self.probe_array = RectArray(win, RECT_SIZE, n_max)
+        self.fix = visual.Circle(win, radius=FIX_RADUS, fillColor='black', lineColor=None)
+        instruct_pos = self.texts['practice_instruct_pos'] if task == 'practice' else (0, 5)
+        self.instruct = visual.TextStim(win, pos=instruct_pos, color='black', height=0.5, wrapWidth=25)
+        self.instruct_continue = visual.TextStim(win, text=self.texts['continue'], pos=(0, -5.5), color='black', height=0.5, wrapWidth=25)
+        self.arrows = dict((direction, visual.ShapeStim(win, fillColor='black', pos=(0, 1.5), lineColor=None, vertices=ARROW_VERTICES * [direction, 1]))
+                           for direction in (-1, 1))  # Just mirror vertices around y-axis
+        if task == 'practice':
+            self.image_task = visual.ImageStim(win, image='intros/pfizer-cda.png')
+            self.image_response_pad = visual.ImageStim(win, image=self.texts['response_pad'], pos=(0, -0.6))
+            self.image_response_pad.size = self.image_response_pad.size / 1.9  # downscale
+
+        self.start_info = start_info = get_start_info(win)
+        if subject_data is not None:
+            start_info['save_file_name'] = '%s %s' % (subject_data['SubInt'], subject_data['SubID'])
+        self.frame_rate = start_info['frame_rate']
+        file_path = os.path.join(start_info['save_file_path'], filename) if filename else start_info['save_file_path'] + '.csv'
+        self.events = EventLog(os.path.splitext(file_path)[0] + '.events')  # binary log of phase onsets and triggers
+        self.triggers = TriggerScheduler(win, events=self.events)
+        self.frame_timer = FrameTimer(win, self.frame_rate, triggers=self.triggers)
+        self.responses = ResponseCapture(device='keyboard' if self.device == 'cedrus_keyboard' else 'mouse', keys=self.answer_keys)
+        self.eog = eog_monitor.open_monitor(self.site['eog']) if task == 'experiment' and self.site.get('eog') else None
+        self.reserve = CDA_generate_trials.ReservePool(trial_params) if self.eog is not None else None  # replaces rejected trials
+        if task == 'experiment':
+            eog_columns = EOG_COLUMNS if self.eog is not None else ()
+            self.writer = BackgroundWriter(file_path, columns=TRIAL_COLUMNS + self.frame_timer.columns() + eog_columns, columnar=True)  # crash-safe without blocking the trial loop on disk I/O
+        else:
+            self.writer = BackgroundWriter(file_path, columns=TRIAL_COLUMNS + PRACTICE_COLUMNS + self.frame_timer.columns())
+
+    def wait_advance(self):
+        """ Wait INSTRUCTION_RESPONSE_START seconds and then for (the release of) an advance key. Returns the key. """
+        core.wait(INSTRUCTION_RESPONSE_START)
+        if self.device == 'mouse':
+            return waitMousePressed(keyList=self.keys_advance, keyEvent='release')
+        return event.waitKeys(keyList=self.keys_advance)[0]
+
+    def ask(self, text=''):
+        """
+        Show a text and returns answer (keypress)
+        and reaction time. Defaults to no text and keysAns.
+        """
+        self.instruct.text = text
+        self.instruct.draw()
+        self.instruct_continue.draw()
+        event.clearEvents()
+        self.win.flip()
+
+        # Halt everything and wait for (first) responses matching the keys given in the Q object.
+        key = self.wait_advance()
+        if event.getKeys(keyList=KEYS_QUIT):
+            core.quit()
+
+        return key
+
+    def prepare_arrays(self, trial):
+        """ Load the rectangles of the memory and probe array of a trial. Takes a few ms, so call it between flips. """
+        self.memory_array.set_rects(trial['xys'], trial['oris'], trial['colors'])
+        probe_oris = list(trial['oris'])
+        probe_oris[trial['probe_id']] = trial['probe_ori']
+        self.probe_array.set_rects(trial['xys'], probe_oris, trial['colors'])
+
+    def prepare_practice(self, blocks, shuffle=None):
+        """ prepare_trials for the practice plus its extra columns. The blocks keep their order if shuffle is None. """
+        trial_list = prepare_trials(blocks, self.start_info, EXP_IDENTIFIERS['practice'], self.site['triggers']['cue_codes'],
+                                    shuffle=shuffle or (lambda block: None))
+        for no, trial in enumerate(trial_list):
+            trial['no_total'] = no  # absolute trial number for the sake of analysis of effects of time
+            trial['response_device'] = self.device
+        return trial_list
+
+    def compile_trial(self, trial, durations, exp_phase='experiment'):
+        """
+        Frame schedule of a trial: what to draw on every frame, when to record
+        the phase onsets and which triggers to send. Call prepare_arrays(trial)
+        before playing the memory array.
+        Triggers are only sent in the experiment. In 'pace_all', the first
+        frame of the phases with an intro text shows it and waits for the
+        subject. The probe then lasts one frame, in 'pace_array' an onset and
+        a hold frame (see run_block).
+        """
+        direction = -1 + 2*(trial['CueSide']=='left')  # -1 or 1 for left or right pointing cue
+        barcode, fix, stamp = self.barcode, self.fix, self.events.stamp
+        channels = self.site['triggers'] if exp_phase == 'experiment' else None
+        probe_frames = {'pace_all': 1, 'pace_array': 2}.get(exp_phase, durations['probe'])
+        phases = [
+            # name, frames, stimuli, barcode colour, onset key, trigger channels
+            ('ITI', durations['ITI'], (barcode, fix), 'black', 'itiUTC', None),
+            ('cue', durations['cue'], (barcode, self.arrows[direction], fix), 'white', 'arrowUTC', channels and channels['cue'][direction]),  # arrow direction
+            ('SOA', durations['SOA'], (barcode, fix), 'black', 'soaUTC', None),
+            ('array1', durations['array1'], (self.memory_array, barcode, fix), 'white', 'memoryArrayUTC', channels and channels['probe'][trial['Probe']]),  # probe type (same/change)
+            ('retention', durations['retention'], (barcode, fix), 'black', 'retentionUTC', None),
+            ('probe', probe_frames, (barcode, self.probe_array, fix), 'white', 'testArrayUTC', channels and channels['test_array'])  # test array appearance
+        ]
+        schedule = []
+        for name, n_frames, stimuli, color, onset_key, trigger in phases:
+            settings = ((barcode, 'fillColor', color), )
+            callbacks = ((stamp, (trial, onset_key)), )
+            triggers = ((lpt_code(trigger), 1), ) if trigger else ()
+            intro = self.texts['intro_phases'].get(name) if exp_phase == 'pace_all' else None
+            if intro:
+                schedule.append(tools.schedule.Phase(name, 1, stimuli + (self.instruct, self.instruct_continue),
+                                                     settings=settings + ((self.instruct, 'text', intro), ),
+                                                     callbacks=callbacks + ((self.wait_advance, ()), ), triggers=triggers))
+                settings, callbacks, triggers, n_frames = (), (), (), n_frames - 1
+            if n_frames:
+                schedule.append(tools.schedule.Phase(name, n_frames, stimuli, settings=settings, callbacks=callbacks, triggers=triggers))
+        return tools.schedule.FrameSchedule(schedule)
+
+    def run_block(self, trial_list, exp_phase='experiment'):
+        """
+        Play, score and save the trials. exp_phase is 'experiment' or one of the
+        practice phases: 'pace_all' (the subject advances through the phases
+        of a trial), 'pace_array' (the probe stays until the response) or
+        'practice_experimenter' (timed like the experiment).
+        If the EOG is monitored, trials with a saccade or blink are replaced
+        at the end of their block (see TrialScheduler).
+        """
+        win, frame_timer, triggers, responses = self.win, self.frame_timer, self.triggers, self.responses
+        trialN = 1
+        blockN = 1
+        # Durations of the different routines differ between experiment and practice
+        durations = DURATIONS['experiment' if exp_phase == 'experiment' else 'practice']
+        paced = {'pace_all': tuple(self.texts['intro_phases']), 'pace_array': ('probe', )}.get(exp_phase, ())  # wait for the subject
+        scheduler = TrialScheduler(trial_list, self.reserve, self.site['eog'].get('requeue', 0) if self.eog is not None else 0)
+        trial_list = scheduler.trials  # replacements are inserted
+
+        # Loop through trials
+        next_schedule = self.compile_trial(trial_list[0], durations, exp_phase) if trial_list else None
+        trial_idx = 0
+        while trial_idx < len(trial_list):
+            trial = trial_list[trial_idx]
+            print "Trial#:", trialN , "Block#:",blockN
+            trialN = trialN + 1
+            if trial['no_block'] == 1 and trial['block'] > 1:
+                self.ask(self.texts['break'])
+                blockN = blockN + 1
+                trialN = 1
+            if self.task == 'practice':
+                trial['exp_phase'] = exp_phase
+
+            schedule = next_schedule
+            frame_timer.start_trial()
+            trial['trialId'] = self.events.start_trial()
+            for code, onset_flip, width_frames in schedule.triggers:
+                triggers.schedule(code, onset_flip, width_frames)
+
+            # ITI. Prepare this trial's arrays and compile the next trial while it is on screen
+            schedule.play(frame_timer.flip, win.callOnFlip, stop=1)
+            self.prepare_arrays(trial)
+            if trial_idx + 1 < len(trial_list):
+                next_schedule = self.compile_trial(trial_list[trial_idx + 1], durations, exp_phase)
+
+            # Rest of the ITI, CUE, SOA, ARRAY 1 and RETENTION
+            probe_onset = schedule.onsets['probe']
+            schedule.play(frame_timer.flip, win.callOnFlip, start=1, stop=probe_onset)
+
+            # PROBE
+            # Keep flipping during the response window and poll responses between flips.
+            # In 'pace_array', the last frame is replayed until the response and once after it
+            key, rt = None, None
+            probe_flips = []
+            frame, stop = probe_onset, len(schedule)
+            while frame < stop:
+                probe_flips.append(schedule.play_frame(frame, frame_timer.flip, win.callOnFlip))
+                if frame == probe_onset:
+                    responses.start(probe_flips[0])  # presses from now on are stamped relative to probe onset
+
+                # Get response. Presses during the last frame count as misses
+                answered = False
+                if key is None and exp_phase != 'pace_all':
+                    key, rt = responses.first(keyList=self.answer_keys)
+                    answered = key is not None
+                    if answered and not PROBE_AFTER_RESPONSE:
+                        schedule.remove(self.probe_array, min(frame + 1, stop - 1))
+                frame += 1
+                if frame == stop and exp_phase == 'pace_array' and (key is None or answered):
+                    frame = stop - 1
+
+            # A basic transformations
+            if key is None:
+                rt = core.monotonicClock.getTime() - probe_flips[0]  # time elapsed since probe onset, not since psychopy.core start
+
+            # Score trial. The paced intro trial has no response
+            if exp_phase != 'pace_all':
+                trial['ans'] = self.keys_ans[key]
+                trial['response.corr'] = int(self.keys_ans[key] == trial['Probe'])
+                trial['rt'] = rt
+                trial['responseFrame'] = int(np.searchsorted(probe_flips, probe_flips[0] + rt, 'right')) - 1 if key is not None else ''  # probe frame on screen at the press
+
+            # SAVE trials if experiment was not exited.
+            if event.getKeys(keyList=KEYS_QUIT):
+                core.quit()
+            scheduler.record(trial, self.tag_eog(trial) if self.eog is not None else True)
+            self.events.format_utc(trial)  # the onsets were stamped as monotonic ns
+            trial['triggers'] = triggers.log  # code, flip, set and clear time of each trigger
+            scheduled = collections.Counter(schedule.phases)  # frames per phase as compiled, e.g. the short probe of a paced practice
+            trial.update(frame_timer.summary(scheduled, probe_flips[-1] + 1 / self.frame_rate, paced))  # actual phase durations and dropped frames. The probe ends with its last frame
+            self.writer.write(trial)  # queued, written and synced by a background thread
+
+            # Replace the rejected trials of a block after its last trial. The next trial was compiled already
+            trial_idx += 1
+            if trial_idx == len(trial_list) or trial_list[trial_idx]['block'] != trial['block']:
+                if scheduler.end_block(trial_idx):
+                    next_schedule = self.compile_trial(trial_list[trial_idx], durations, exp_phase)
+
+        if self.eog is not None and scheduler.missing():
+            print 'valid trials missing per (Condition, numTargets):', sorted(scheduler.missing().items())
+
+    def tag_eog(self, trial):
+        """
+        Tag the trial with eog_saccade and eog_blink (see EOG_WINDOW). Call it
+        before formatting the onsets. Returns whether the trial is valid: no
+        saccade or blink, or the stream did not tell in time.
+        """
+        trial.setdefault('replacement', 0)
+        trial.update(self.eog.flags(trial[EOG_WINDOW[0]] / 10**9, trial[EOG_WINDOW[1]] / 10**9))
+        return trial['eog_saccade'] != 1 and trial['eog_blink'] != 1
+
+    def experimenter_evaluation(self, trial_list):
+        """Given a trial list, present a screen which allows the experimenter
+        to assess the subject's performance and repeat the practice, if judged
+        necessary. Returns 'r' to repeat or 'c' to continue."""
+        lines = []
+        for n_targets, n_distractors in itertools.product(PRACTICE_PARAMS['Ntargets'], PRACTICE_PARAMS['Ndistractors']):
+            scores = [trial['response.corr'] for trial in trial_list if trial['numTargets'] == n_targets and trial['numDistracts'] == n_distractors]
+            lines.append('SS%i+%i: %.2f %% of %i trials' % (n_targets, n_distractors, sum(scores) / len(scores) * 100, len(scores)))
+        self.instruct.text = u'\n%s\n\n%s\n' % ('\n'.join(lines), self.texts['evaluation'])
+
+        self.instruct.draw()
+        self.win.flip()
+
+        # Now wait for the experimenter's response. Repeat intro or continue
+        return event.waitKeys(keyList=['r', 'c'])[0]
+
+    def run_intro(self):
+        """Runs the full introduction and practice until the experimenter continues after the evaluation"""
+        while True:
+            intro_trials = self.prepare_practice(make_intro_trials())
+
+            # Run instructions and practice
+            self.image_task.draw()
+            self.ask(self.texts['intro'])
+            self.run_block(intro_trials[:1], 'pace_all')
+            while self.device == 'mouse' and getMousePressed() is not None:  # wait for mouse release
+                pass
+
+            # Run practice with wait-for-subject
+            self.image_response_pad.draw()
+            self.ask(self.texts['practice'][0])
+            self.ask(self.texts['practice'][1])
+            self.run_block(intro_trials[1:], 'pace_array')
+
+            # Run the actual practice and show the feedback for the experimenter
+            self.ask(self.texts['practice'][2])
+            trial_list = self.prepare_practice(make_practice_trials(self.site['practice_repetitions']), shuffle=np.random.shuffle)
+            self.run_block(trial_list, 'practice_experimenter')
+            if self.experimenter_evaluation(trial_list) != 'r':
+                break
+
+
+def run_experiment(language, site):
+    """ Show the dialogue, open the Window and run the session. Prints how long the startup took. """
+    imported = core.monotonicClock.getTime()  # started when psychopy was imported
+    gui_output = DIALOGUES[SITES[site]['dialogue']]()
+    # if cancel clicked => quit
+    if gui_output is None:
+        core.quit()
+    experiment_params, subject_data, filename, trials = gui_output
+    dialogue_closed = core.monotonicClock.getTime()
+
+    # Run the real thing!
+    experiment = Task('experiment', language, site, experiment_params, subject_data, filename)  # the trials are read meanwhile
+    trial_list = prepare_trials(trials.result(), experiment.start_info, EXP_IDENTIFIERS['experiment'], SITES[site]['triggers']['cue_codes'])
+    print 'startup: %.2f s of imports, %.2f s from the dialogue to the first instruction' % (imported, core.monotonicClock.getTime() - dialogue_closed)
+    experiment.ask(experiment.texts['experiment'])
+    experiment.run_block(trial_list)
+    experiment.ask(experiment.texts['finish'])
+
+
+def run_practice(language, site):
+    """ Open the Window and run the introduction. This will self-loop until experimenter tells it to continue. """
+    Task('practice', language, site, PRACTICE_PARAMS).run_intro()
+
+
+def main(task='experiment', language=None, site='rrlab'):
+    """ Run task in language at site. The language defaults to the site's. """
+    language = language or SITES[site]['language']
+    if task == 'experiment':
+        run_experiment(language, site)
+    else:
+        run_practice(language, site)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run the CDA experiment or practice.')
+    parser.add_argument('--task', choices=TASKS, default='experiment', help='the experiment or the introduction and practice')
+    parser.add_argument('--language', choices=sorted(LANGUAGES), help="language of the texts. The site's by default")
+    parser.add_argument('--site', choices=sorted(SITES), default='rrlab', help='monitors, triggers, response device and dialogue')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args.task, args.language, args.site)
@@ -0,0 +1,406 @@
+# -*- coding: utf-8 -*-
+"""
+This module detects saccades and blinks in the EOG of a recording like
+matlab/detect_saccades_blinks.m, which it replaces in the offline pipeline.
+
+The HEOG and VEOG are bandpass filtered (0.1-5 Hz, fir1 of order 50),
+differentiated and combined to the 1D signal sqrt(dHEOG^2 + dVEOG^2). An
+event is the first sample of the signal above its threshold that is at
+least min_gap after the previous event:
+ * a blink is above the blink threshold, more than min_gap after the
+   previous blink. It replaces the last saccade, which was its onset.
+ * a saccade is above the saccade threshold, more than min_gap after the
+   previous blink or saccade.
+After an event of a kind, the next one needs the signal to drop below the
+threshold first.
+
+The MATLAB script tests these rules sample by sample. detect_events only
+visits the samples where an event can happen: the state of the rules only
+changes at events, so the next candidate of each kind is the first sample
+above the threshold after the refractory gap and after the signal dropped
+below the threshold, which is a binary search in the threshold crossings.
+detect_events_reference is the sample by sample version, to check against.
+
+StreamingEOG does the same for HEOG and VEOG that arrive in chunks, e.g.
+while the recording is written: an overlap-save FIR filter and the
+EventDetector keep their state from one chunk to the next and it returns
+the events of each chunk as soon as they are found. Its events are the same
+as those of the whole recording.
+
+Event positions are indices into the 1D signal, which is one sample shorter
+than the recording. The MATLAB script counts from 1, so its sample numbers
+are one larger.
+
+Usage:
+    saccade_threshold, blink_threshold = read_thresholds('Data/014/thresholds.txt')
+    with gtec_hdf5.Recording('Data/014/014 CDT preTRAIN1 C01-LKE-D1 15-03-2019 11-36-25.hdf5') as recording:
+        saccades, blinks = detect_saccades_blinks(recording, saccade_threshold, blink_threshold)
+
+Or from the command line, also to compare with the reference or the
+.mat written by detect_saccades_blinks.m:
+    python eog.py recording.hdf5 thresholds.txt --check --matlab recording.mat
+--chunk 10 also streams the recording in chunks of 10 s and compares.
+Without lab data, python eog.py --self-check runs these comparisons on
+synthetic EOG and exits with 1 if any differs.
+"""
+
+from __future__ import division, print_function
+import argparse
+import collections
+import timeit
+import numpy as np
+
+BANDPASS = (0.1, 5)  # Hz
+FIR_ORDER = 50
+MIN_GAP_SEC = 0.5  # minimal gap between saccades/blinks in seconds
+CHANNELS = ('HEOG', 'VEOG')
+
+
+def read_thresholds(path):
+    """ (saccade threshold, blink threshold) from the second line of a thresholds.txt like matlab/read_thresholds.m """
+    with open(path) as file_object:
+        file_object.readline()  # header
+        values = file_object.readline().split(',')
+    return float(values[0]), float(values[1])
+
+
+def fir1_bandpass(order, low, high, fs):
+    """ Coefficients of MATLAB's fir1(order, [low high] / (fs/2)): a Hamming windowed sinc, gain 1 at the band center """
+    low, high = low / (fs / 2), high / (fs / 2)
+    m = np.arange(order + 1) - order / 2
+    b = (high * np.sinc(high * m) - low * np.sinc(low * m)) * np.hamming(order + 1)
+    center = (low + high) / 2
+    return b / abs(np.sum(b * np.exp(-1j * np.pi * center * m)))
+
+
+def lfilter(b, x):
+    """ MATLAB's filter(b, 1, x) with zero initial state """
+    return np.convolve(x, b)[:len(x)]
+
+
+def filtfilt(b, x):
+    """
+    Zero-phase forward and backward filtering like MATLAB's filtfilt(b, 1, x),
+    with the edges extended by 3*order samples of odd reflection.
+    """
+    pad = min(3 * (len(b) - 1), len(x) - 1)
+    padded = np.concatenate((2*x[0] - x[pad:0:-1], x, 2*x[-1] - x[-2:-pad - 2:-1]))
+    y = lfilter(b, lfilter(b, padded)[::-1])[::-1]
+    return y[pad:pad + len(x)]
+
+
+def eog_signal(heog, veog, fs, zero_phase=False):
+    """
+    The 1D signal of detect_saccades_blinks.m: magnitude of the derivative of
+    the bandpass filtered HEOG and VEOG. zero_phase filters forward and
+    backward instead of forward only, which shifts the events earlier and
+    changes them compared to the MATLAB script.
+    """
+    b = fir1_bandpass(FIR_ORDER, BANDPASS[0], BANDPASS[1], fs)
+    apply = filtfilt if zero_phase else lfilter
+    return np.hypot(np.diff(apply(b, np.asarray(heog, dtype=float))), np.diff(apply(b, np.asarray(veog, dtype=float))))
+
+
+class OverlapSaveFilter(object):
+    """
+    filter(b, 1, x) of a signal which arrives in chunks of any length, by FFT
+    overlap-save. The last len(b)-1 samples are kept for the next chunk, so
+    the output is the same as filtering the whole signal at once (up to float
+    rounding) while the memory does not grow with its length.
+    """
+    def __init__(self, b, nfft=None):
+        self.b = np.asarray(b, dtype=float)
+        self.overlap = len(self.b) - 1
+        self.nfft = nfft or 2**int(np.ceil(np.log2(8*len(self.b))))  # FFT length. Each FFT yields nfft - overlap outputs
+        self.step = self.nfft - self.overlap
+        self.spectrum = np.fft.rfft(self.b, self.nfft)
+        self.history = np.zeros(self.overlap)  # zero initial state like filter()
+
+    def __call__(self, x):
+        x = np.asarray(x, dtype=float)
+        if not len(x):
+            return x
+        extended = np.concatenate((self.history, x))
+        n_blocks = -(-len(x) // self.step)
+        padded = np.zeros(n_blocks*self.step + self.overlap)
+        padded[:len(extended)] = extended
+        blocks = np.lib.stride_tricks.as_strided(padded, (n_blocks, self.nfft), (self.step*padded.strides[0], padded.strides[0]))
+        y = np.fft.irfft(np.fft.rfft(blocks, axis=1) * self.spectrum, self.nfft, axis=1)[:, self.overlap:]
+        self.history = extended[len(extended) - self.overlap:]
+        return y.ravel()[:len(x)]
+
+
+Event = collections.namedtuple('Event', 'kind sample replaces')  # replaces: the saccade a blink removed or None
+
+
+class EventDetector(object):
+    """
+    Finds saccade and blink onsets (see the module docstring) in a signal
+    which arrives in chunks, carrying the state of the rules from one chunk
+    to the next. process(chunk) returns the Events found in it. A blink
+    removes the last saccade, also one returned for an earlier chunk, which is
+    why the blink Event names it in replaces.
+
+    :saccades, blinks: lists of the onsets so far, as indices into the whole signal.
+    """
+    KINDS = ('blink', 'saccade')  # a blink on the same sample removes the saccade before
+
+    def __init__(self, saccade_threshold, blink_threshold, min_gap):
+        """ min_gap is in samples """
+        self.thresholds = {'saccade': saccade_threshold, 'blink': blink_threshold}
+        self.min_gap = min_gap
+        self.saccades, self.blinks = [], []
+        self.free = {'saccade': 0, 'blink': 0}  # first index after the signal dropped below the threshold since the last event. None until it does
+        self.n = 0  # samples processed
+
+    def after_gap(self, last):
+        """ First index more than min_gap after last """
+        return int(np.floor(last + self.min_gap)) + 1 if last is not None else 0
+
+    def process(self, chunk):
+        offset = self.n
+        self.n += len(chunk)
+        above = dict((kind, np.flatnonzero(chunk > threshold) + offset) for kind, threshold in self.thresholds.items())
+        below = dict((kind, np.flatnonzero(chunk < threshold) + offset) for kind, threshold in self.thresholds.items())
+        for kind in self.KINDS:
+            if self.free[kind] is None:
+                self.free[kind] = self._after(below[kind], offset)
+
+        events = []
+        start = offset
+        while True:
+            last_blink = self.blinks[-1] if self.blinks else None
+            last_event = max(self.blinks[-1:] + self.saccades[-1:]) if self.blinks or self.saccades else None
+            candidates = {
+                'blink': self._first(above['blink'], start, self.free['blink'], self.after_gap(last_blink)),
+                'saccade': self._first(above['saccade'], start, self.free['saccade'], self.after_gap(last_event))
+            }
+            onsets = [onset for onset in candidates.values() if onset is not None]
+            if not onsets:
+                return events
+            onset = min(onsets)
+            for kind in self.KINDS:
+                if candidates[kind] == onset:
+                    replaces = None
+                    if kind == 'blink':
+                        replaces = self.saccades.pop() if self.saccades else None  # the last saccade was the onset of the blink
+                        self.blinks.append(onset)
+                    else:
+                        self.saccades.append(onset)
+                    events.append(Event(kind, onset, replaces))
+                    self.free[kind] = self._after(below[kind], onset + 1)
+            start = onset + 1
+
+    @staticmethod
+    def _first(indices, *lower_bounds):
+        """ First of the sorted indices which is >= all lower_bounds, or None. None if a bound is None. """
+        if None in lower_bounds:
+            return None
+        pos = np.searchsorted(indices, max(lower_bounds))
+        return int(indices[pos]) if pos < len(indices) else None
+
+    @classmethod
+    def _after(cls, below, start):
+        """ The index after the first of below from start on, or None """
+        reset = cls._first(below, start)
+        return reset + 1 if reset is not None else None
+
+
+def detect_events(signal, saccade_threshold, blink_threshold, min_gap):
+    """
+    Saccade and blink onsets in signal (see the module docstring) as two
+    arrays of indices. min_gap is in samples.
+    """
+    detector = EventDetector(saccade_threshold, blink_threshold, min_gap)
+    detector.process(signal)
+    return np.array(detector.saccades, dtype=int), np.array(detector.blinks, dtype=int)
+
+
+class StreamingEOG(object):
+    """
+    eog_signal and EventDetector for HEOG and VEOG which arrive in chunks,
+    e.g. read from a recording that is still being written. Memory does not
+    grow with the length of the recording. The filter is causal like in the
+    MATLAB script. A zero-phase filter would need the future samples.
+
+    Usage:
+        stream = StreamingEOG(recording.fs, saccade_threshold, blink_threshold)
+        for heog, veog in chunks:
+            for event in stream.process(heog, veog):
+                ...
+    """
+    def __init__(self, fs, saccade_threshold, blink_threshold, min_gap_sec=MIN_GAP_SEC):
+        b = fir1_bandpass(FIR_ORDER, BANDPASS[0], BANDPASS[1], fs)
+        self.filters = (OverlapSaveFilter(b), OverlapSaveFilter(b))
+        self.last = None  # last filtered HEOG and VEOG sample, for the derivative
+        self.detector = EventDetector(saccade_threshold, blink_threshold, min_gap_sec * fs)
+
+    def process(self, heog, veog):
+        """ Events in the next chunk of samples. Their sample is an index into the whole 1D signal """
+        filtered = [apply(chunk) for apply, chunk in zip(self.filters, (heog, veog))]
+        if not len(filtered[0]):
+            return []
+        if self.last is not None:
+            filtered = [np.concatenate(([last], channel)) for last, channel in zip(self.last, filtered)]
+        self.last = [channel[-1] for channel in filtered]
+        return self.detector.process(np.hypot(np.diff(filtered[0]), np.diff(filtered[1])))
+
+
+def stream_events(recording, saccade_threshold, blink_threshold, min_gap_sec=MIN_GAP_SEC, chunk_seconds=10.0):
+    """ Iterate over the Events of a gtec_hdf5.Recording, reading chunk_seconds at a time """
+    stream = StreamingEOG(recording.fs, saccade_threshold, blink_threshold, min_gap_sec)
+    for start, samples in recording.windows(chunk_seconds, CHANNELS):
+        for event in stream.process(samples[:, 0], samples[:, 1]):
+            yield event
+
+
+def detect_events_reference(signal, saccade_threshold, blink_threshold, min_gap):
+    """ detect_events sample by sample, in the order of detect_saccades_blinks.m. Slow. """
+    saccades, blinks = [], []
+    found_saccade = found_blink = False
+    for i, value in enumerate(signal):
+        last_blink = blinks[-1] if blinks else -min_gap - 1
+        last_saccade = saccades[-1] if saccades else -min_gap - 1
+        last_event = max(last_blink, last_saccade)
+        if value > blink_threshold and not found_blink and i - last_blink > min_gap:
+            blinks.append(i)
+            found_blink = True
+            saccades = saccades[:-1]  # remove last saccade
+        if value > saccade_threshold and not found_saccade and i - last_event > min_gap:
+            saccades.append(i)
+            found_saccade = True
+        if value < saccade_threshold:
+            found_saccade = False
+        if value < blink_threshold:
+            found_blink = False
+    return np.array(saccades, dtype=int), np.array(blinks, dtype=int)
+
+
+def detect_saccades_blinks(recording, saccade_threshold, blink_threshold, min_gap_sec=MIN_GAP_SEC, zero_phase=False):
+    """ Saccade and blink onsets in a gtec_hdf5.Recording, as indices into its eog_signal """
+    samples = recording.read(0, len(recording), CHANNELS)
+    signal = eog_signal(samples[:, 0], samples[:, 1], recording.fs, zero_phase)
+    return detect_events(signal, saccade_threshold, blink_threshold, min_gap_sec * recording.fs)
+
+
+def read_matlab_events(mat_path):
+    """ (saccades, blinks) in the annotation of the .mat written by detect_saccades_blinks.m, as indices like detect_events """
+    import scipy.io  # only needed for this comparison
+    annotation = scipy.io.loadmat(mat_path, squeeze_me=True)['annotation']
+    names = np.array([str(name) for name in np.atleast_1d(annotation['event'].item())])
+    sample_numbers = np.atleast_1d(annotation['sampleN'].item()).astype(int)
+    return sample_numbers[names == 'EOG_saccade'] - 1, sample_numbers[names == 'EOG_blink'] - 1
+
+
+def compare(name, expected, actual):
+    """ Print whether two arrays of events are equal and where they differ. Returns True if equal. """
+    if np.array_equal(expected, actual):
+        print('%s: identical' % name)
+        return True
+    print('%s: DIFFERENT. only in the first: %s, only in the second: %s' % (
+        name, np.setdiff1d(expected, actual)[:10].tolist(), np.setdiff1d(actual, expected)[:10].tolist()))
+    return False
+
+
+def synthetic_eog(n, fs, rng):
+    """ HEOG and VEOG of n samples: drift and noise with saccade-like steps and blink-like bumps at random times """
+    heog, veog = np.cumsum(rng.normal(0, 0.01, (2, n)), axis=1) + rng.normal(0, 0.05, (2, n))
+    for onset in rng.randint(0, n, n // int(2 * fs)):
+        heog[onset:] += rng.uniform(-5, 5)  # saccade: a step in the HEOG
+        veog[onset:onset + int(0.2 * fs)] += rng.uniform(5, 20) * np.hanning(len(veog[onset:onset + int(0.2 * fs)]))  # blink
+    return heog, veog
+
+
+def self_check(n_signals=20, seed=0, fs=256):
+    """
+    Check detect_events against detect_events_reference and StreamingEOG in
+    random chunks against eog_signal and detect_events, on synthetic EOG. No
+    recording needed. Prints the differences and returns True if there are none.
+    """
+    rng = np.random.RandomState(seed)
+    b = fir1_bandpass(FIR_ORDER, BANDPASS[0], BANDPASS[1], fs)
+    equal = True
+    for i in range(n_signals):
+        heog, veog = synthetic_eog(rng.randint(fs, 120 * fs), fs, rng)
+        signal = eog_signal(heog, veog, fs)
+        saccade_threshold, blink_threshold = np.percentile(signal, sorted(rng.uniform(80, 99.9, 2)))
+        min_gap = rng.choice([0, MIN_GAP_SEC, rng.uniform(0, 2)]) * fs
+        events = detect_events(signal, saccade_threshold, blink_threshold, min_gap)
+        for name, expected, actual in zip(('saccades', 'blinks'), detect_events_reference(signal, saccade_threshold, blink_threshold, min_gap), events):
+            equal &= compare('signal %i: reference %s' % (i, name), expected, actual)
+
+        overlap_save = OverlapSaveFilter(b)
+        stream = StreamingEOG(fs, saccade_threshold, blink_threshold, min_gap / fs)
+        bounds = np.unique(np.concatenate(([0, len(heog)], rng.randint(0, len(heog), rng.randint(1, 50)))))
+        filtered, streamed = [], {'saccade': [], 'blink': []}
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            filtered.append(overlap_save(heog[start:stop]))
+            for event in stream.process(heog[start:stop], veog[start:stop]):
+                if event.replaces is not None:
+                    streamed['saccade'].remove(event.replaces)
+                streamed[event.kind].append(event.sample)
+        if not np.allclose(np.concatenate(filtered), lfilter(b, heog), atol=1e-9):
+            print('signal %i: OverlapSaveFilter DIFFERENT from lfilter' % i)
+            equal = False
+        for name, kind, expected in zip(('saccades', 'blinks'), ('saccade', 'blink'), events):
+            equal &= compare('signal %i: streamed %s' % (i, name), expected, np.array(streamed[kind], dtype=int))
+    return equal
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Detect saccades and blinks in the EOG of a g.tec recording.')
+    parser.add_argument('recording', nargs='?', help='.hdf5 file')
+    parser.add_argument('thresholds', nargs='?', help='thresholds.txt with the saccade and blink thresholds on its second line')
+    parser.add_argument('--min-gap', type=float, default=MIN_GAP_SEC, help='minimal gap between events in seconds')
+    parser.add_argument('--zero-phase', action='store_true', help='filter forward and backward. Differs from the MATLAB script')
+    parser.add_argument('--check', action='store_true', help='compare with the sample by sample reference')
+    parser.add_argument('--matlab', help='compare with the annotation in this .mat from detect_saccades_blinks.m')
+    parser.add_argument('--chunk', type=float, help='compare with StreamingEOG reading chunks of this many seconds')
+    parser.add_argument('--self-check', action='store_true', help='check the detector and streaming on synthetic EOG instead of a recording')
+    args = parser.parse_args()
+    if not args.self_check and not (args.recording and args.thresholds):
+        parser.error('a recording and thresholds are needed unless --self-check is given')
+    return args
+
+
+def main():
+    args = parse_args()
+    if args.self_check:
+        raise SystemExit(0 if self_check() else 1)
+    import gtec_hdf5
+    saccade_threshold, blink_threshold = read_thresholds(args.thresholds)
+    with gtec_hdf5.Recording(args.recording) as recording:
+        start = timeit.default_timer()
+        samples = recording.read(0, len(recording), CHANNELS)
+        signal = eog_signal(samples[:, 0], samples[:, 1], recording.fs, args.zero_phase)
+        filtered = timeit.default_timer()
+        min_gap = args.min_gap * recording.fs
+        saccades, blinks = detect_events(signal, saccade_threshold, blink_threshold, min_gap)
+        detected = timeit.default_timer()
+        if args.chunk:
+            streamed = {'saccade': [], 'blink': []}
+            for event in stream_events(recording, saccade_threshold, blink_threshold, args.min_gap, args.chunk):
+                if event.replaces is not None:
+                    streamed['saccade'].remove(event.replaces)
+                streamed[event.kind].append(event.sample)
+            print('Streamed in chunks of %g s in %.3f s' % (args.chunk, timeit.default_timer() - detected))
+    print('%i saccades and %i blinks in %.0f s. Read and filtered in %.3f s, detected in %.3f s' % (
+        len(saccades), len(blinks), len(signal) / recording.fs, filtered - start, detected - filtered))
+
+    equal = True
+    if args.check:
+        for name, expected, actual in zip(('saccades', 'blinks'), detect_events_reference(signal, saccade_threshold, blink_threshold, min_gap), (saccades, blinks)):
+            equal &= compare('reference ' + name, expected, actual)
+    if args.matlab:
+        for name, expected, actual in zip(('saccades', 'blinks'), read_matlab_events(args.matlab), (saccades, blinks)):
+            equal &= compare('MATLAB ' + name, expected, actual)
+    if args.chunk:
+        if args.zero_phase:
+            print('streaming filters forward only, compare it without --zero-phase')
+        for name, kind, expected in zip(('saccades', 'blinks'), ('saccade', 'blink'), (saccades, blinks)):
+            equal &= compare('streamed ' + name, expected, np.array(streamed[kind], dtype=int))
+    raise SystemExit(0 if equal else 1)
+
+
+if __name__ == '__main__':
+    main()
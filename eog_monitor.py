@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+This module detects saccades and blinks in the EOG while the experiment
+runs, so that contaminated trials are known before they are saved instead
+of after the session (matlab/compPerformance.m).
+
+A background thread reads the samples from the acquisition stream, runs
+eog.StreamingEOG on them and keeps the onsets of the events. The stream is
+raw interleaved samples (little-endian float32 by default, samples x
+n_channels) from a TCP socket or appended to a file, which is what a
+forwarding process of the amplifier or `python eog_monitor.py replay`
+provides. Samples are mapped to core.getTime() through the arrival times of
+the samples: the earliest arrival relative to the sample count is taken as
+the clock offset. An event is timed at its sample of the EOG signal, like
+in the annotation of matlab/detect_saccades_blinks.m, so trials are
+rejected as they would be offline.
+
+Usage:
+    monitor = open_monitor({'stream': 'tcp://localhost:5001', 'fs': 256, 'n_channels': 4, 'channels': (2, 3),
+                            'thresholds': 'thresholds.txt'})
+    ... present the trial ...
+    trial.update(monitor.flags(cue_onset, probe_onset))  # eog_saccade and eog_blink, 1 or 0
+    monitor.close()
+
+Test without the amplifier by replaying a g.tec recording in real time and
+watching the events in another terminal:
+    python eog_monitor.py replay recording.hdf5 tcp://localhost:5001
+    python eog_monitor.py watch tcp://localhost:5001 thresholds.txt --fs 256 --n-channels 4 --channels 2 3
+"""
+
+from __future__ import division, print_function
+import os
+import bisect
+import socket
+import atexit
+import argparse
+import threading
+import numpy as np
+from psychopy import core
+
+import eog
+
+POLL_INTERVAL = 0.005  # seconds between reads of an idle stream
+FLAG_TIMEOUT = 0.1  # seconds flags waits for the stream to reach the end of a window
+FLAG_KEYS = {'saccade': 'eog_saccade', 'blink': 'eog_blink'}
+
+
+class RawSource(object):
+    """
+    Samples of the HEOG and VEOG channels of a raw stream. read() returns the
+    complete samples received since the last call (samples x 2, possibly
+    none) or None when the stream has ended.
+    """
+    def __init__(self, n_channels, channels, dtype='<f4'):
+        self.dtype = np.dtype(dtype)
+        self.n_channels = n_channels
+        self.channels = list(channels)
+        self.frame_bytes = self.dtype.itemsize * n_channels
+        self.pending = b''  # the start of an incomplete sample
+
+    def _samples(self, data):
+        """ The complete samples in pending + data. Keeps the rest for the next call. """
+        data = self.pending + data
+        end = len(data) - len(data) % self.frame_bytes
+        self.pending = data[end:]
+        return np.frombuffer(data[:end], dtype=self.dtype).reshape(-1, self.n_channels)[:, self.channels].astype(float)
+
+
+class FileSource(RawSource):
+    """ Tails a file which the acquisition appends to. Only samples appended after opening are read. """
+    def __init__(self, path, n_channels, channels, dtype='<f4'):
+        super(FileSource, self).__init__(n_channels, channels, dtype)
+        self.file_object = open(path, 'rb')
+        self.file_object.seek(0, os.SEEK_END)
+
+    def read(self):
+        return self._samples(self.file_object.read())
+
+    def close(self):
+        self.file_object.close()
+
+
+class SocketSource(RawSource):
+    """ Receives the samples from a TCP server """
+    def __init__(self, host, port, n_channels, channels, dtype='<f4', timeout=POLL_INTERVAL):
+        super(SocketSource, self).__init__(n_channels, channels, dtype)
+        self.socket = socket.create_connection((host, port))
+        self.socket.settimeout(timeout)
+
+    def read(self):
+        try:
+            data = self.socket.recv(65536)
+        except socket.timeout:
+            data = None
+        if data == b'':
+            return None  # closed by the server
+        return self._samples(data or b'')
+
+    def close(self):
+        self.socket.close()
+
+
+def open_source(stream, n_channels, channels, dtype='<f4'):
+    """ SocketSource for 'tcp://host:port', else FileSource of the path stream """
+    if stream.startswith('tcp://'):
+        host, port = stream[len('tcp://'):].rsplit(':', 1)
+        return SocketSource(host, int(port), n_channels, channels, dtype)
+    return FileSource(stream, n_channels, channels, dtype)
+
+
+class EOGMonitor(object):
+    """
+    Detects saccades and blinks in a RawSource on a background thread. See
+    the module docstring.
+
+    :onsets: dict of 'saccade' and 'blink' to the sorted onsets so far, as indices into the EOG signal.
+    :processed: number of samples of the EOG signal detected in so far.
+    """
+    def __init__(self, source, fs, saccade_threshold, blink_threshold, min_gap_sec=eog.MIN_GAP_SEC, latency=0.0):
+        """
+        :source: a RawSource. Closed with the monitor.
+        :fs: sampling frequency in Hz.
+        :latency: seconds from the acquisition of a sample to its arrival, if known. Shifts the events earlier.
+        """
+        self.source = source
+        self.fs = fs
+        self.latency = latency
+        self.stream = eog.StreamingEOG(fs, saccade_threshold, blink_threshold, min_gap_sec)
+        self.onsets = {'saccade': [], 'blink': []}
+        self.processed = 0
+        self.received = 0
+        self.offset = None  # core.getTime() of the first sample
+        self.condition = threading.Condition()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True  # close() is called on exit instead
+        self.thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while not self.stopped.is_set():
+            samples = self.source.read()
+            if samples is None:
+                break
+            if not len(samples):
+                self.stopped.wait(POLL_INTERVAL)
+                continue
+            self.received += len(samples)
+            offset = core.getTime() - self.received / self.fs - self.latency  # the samples arrived late, never early
+            events = self.stream.process(samples[:, 0], samples[:, 1])
+            with self.condition:
+                self.offset = offset if self.offset is None else min(self.offset, offset)
+                for event in events:
+                    if event.replaces is not None:
+                        self.onsets['saccade'].remove(event.replaces)
+                    self.onsets[event.kind].append(event.sample)
+                self.processed = self.stream.detector.n
+                self.condition.notify_all()
+
+    def index(self, t):
+        """ Index into the EOG signal of the first sample at or after the core.getTime() t """
+        return int(np.ceil((t - self.offset) * self.fs))
+
+    def flags(self, start, stop, timeout=FLAG_TIMEOUT):
+        """
+        {'eog_saccade': 1 or 0, 'eog_blink': 1 or 0}, whether a saccade or
+        blink started from the core.getTime() start to stop. Waits up to
+        timeout seconds for the stream to reach stop. The flags are '' if it
+        does not or if the stream has not started.
+        """
+        deadline = core.getTime() + timeout
+        with self.condition:
+            while self.offset is None or self.processed <= self.index(stop):
+                remaining = deadline - core.getTime()
+                if remaining <= 0 or not self.thread.is_alive():
+                    return dict((key, '') for key in FLAG_KEYS.values())
+                self.condition.wait(remaining)
+            first, end = self.index(start), self.index(stop)
+            return dict((FLAG_KEYS[kind], int(bisect.bisect_left(onsets, end) > bisect.bisect_left(onsets, first)))
+                        for kind, onsets in self.onsets.items())
+
+    def close(self):
+        """ Stop the thread and close the source. Called automatically on exit. """
+        if not self.stopped.is_set():
+            self.stopped.set()
+            self.thread.join()
+            self.source.close()
+
+
+def open_monitor(config):
+    """
+    EOGMonitor of a site's 'eog' config (see CDA_sites.py): 'stream',
+    'fs', 'n_channels', 'channels' (of HEOG and VEOG), 'thresholds' (path of
+    a thresholds.txt) and optionally 'dtype', 'min_gap' (seconds) and 'latency'.
+    """
+    saccade_threshold, blink_threshold = eog.read_thresholds(config['thresholds'])
+    source = open_source(config['stream'], config['n_channels'], config['channels'], config.get('dtype', '<f4'))
+    return EOGMonitor(source, config['fs'], saccade_threshold, blink_threshold, config.get('min_gap', eog.MIN_GAP_SEC),
+                      config.get('latency', 0.0))
+
+
+def replay(recording_path, stream, speed=1.0, chunk_seconds=0.02):
+    """ Send the samples of a g.tec recording to stream ('tcp://host:port' to serve, else a file to append to) in real time """
+    import gtec_hdf5  # only for the stand-in
+    with gtec_hdf5.Recording(recording_path) as recording:
+        if stream.startswith('tcp://'):
+            host, port = stream[len('tcp://'):].rsplit(':', 1)
+            server = socket.socket()
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server.bind((host, int(port)))
+            server.listen(1)
+            print('waiting for a connection on %s' % stream)
+            connection = server.accept()[0]
+            send = connection.sendall
+        else:
+            file_object = open(stream, 'ab')
+            send = lambda data: (file_object.write(data), file_object.flush())
+        print('replaying %s, %i channels at %g Hz' % (recording_path, len(recording.channel_names), recording.fs))
+        start = core.getTime()
+        for first, samples in recording.windows(chunk_seconds):
+            core.wait(start + (first + len(samples)) / recording.fs / speed - core.getTime())  # when the last sample was acquired
+            send(np.ascontiguousarray(samples, dtype='<f4').tobytes())
+
+
+def watch(stream, thresholds, fs, n_channels, channels):
+    """ Print the events of a stream as they are detected, until it ends or ctrl+c. A saccade which a blink replaces later stays printed. """
+    monitor = open_monitor({'stream': stream, 'fs': fs, 'n_channels': n_channels, 'channels': channels, 'thresholds': thresholds})
+    printed = set()
+    try:
+        while monitor.thread.is_alive():
+            core.wait(0.5)
+            with monitor.condition:
+                events = set((sample, kind) for kind, onsets in monitor.onsets.items() for sample in onsets)
+            for sample, kind in sorted(events - printed):
+                print('%s at %.3f s' % (kind, sample / fs))
+            printed |= events
+    except KeyboardInterrupt:
+        pass
+    monitor.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Stand-in EOG stream and live event detection.')
+    commands = parser.add_subparsers(dest='command')
+    replay_parser = commands.add_parser('replay', help='stream a g.tec recording in real time')
+    replay_parser.add_argument('recording', help='.hdf5 file')
+    replay_parser.add_argument('stream', help='tcp://host:port to serve or a file to append to')
+    replay_parser.add_argument('--speed', type=float, default=1.0, help='times real time')
+    watch_parser = commands.add_parser('watch', help='print the saccades and blinks of a stream')
+    watch_parser.add_argument('stream', help='tcp://host:port or a file being appended to')
+    watch_parser.add_argument('thresholds', help='thresholds.txt with the saccade and blink thresholds on its second line')
+    watch_parser.add_argument('--fs', type=float, default=256, help='sampling frequency in Hz')
+    watch_parser.add_argument('--n-channels', type=int, required=True, help='channels in a sample')
+    watch_parser.add_argument('--channels', type=int, nargs=2, required=True, help='indices of HEOG and VEOG')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.command == 'replay':
+        replay(args.recording, args.stream, args.speed)
+    else:
+        watch(args.stream, args.thresholds, args.fs, args.n_channels, args.channels)
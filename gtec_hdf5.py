@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+This module reads the .hdf5 recordings of g.Recorder (g.tec) which are saved
+alongside the session CSVs, without loading the samples into memory.
+matlab/ghdf5read.m reads the same files, but all at once.
+
+File layout:
+ * RawData/Samples: samples x channels (MATLAB shows it transposed).
+ * RawData/AcquisitionTaskDescription: XML with the SamplingFrequency and one
+   ChannelProperties element per channel (ChannelName, ...).
+ * AsynchronData/Time, TypeID, Value: sample number, marker type and level
+   (1 high, 0 low) of every trigger or marker edge.
+ * AsynchronData/AsynchronSignalTypes: XML with one AsynchronSignalDescription
+   (Name, ID, Description, ...) per marker type.
+
+The descriptions and markers are parsed once when the file is opened. The
+samples are read on demand: contiguous, uncompressed Samples are
+memory-mapped, so channels are strided views into the file. Chunked or
+compressed Samples are read in blocks of whole rows, of which the most
+recently used are cached.
+
+Usage:
+    recording = Recording('014 CDT preTRAIN1 C01-LKE-D1 15-03-2019 11-36-25.hdf5')
+    heog = recording.channel('HEOG')
+    first_second = heog[:int(recording.fs)]
+    for start, samples in recording.windows(10.0, channels=('HEOG', 'VEOG')):
+        ...  # samples x 2 array of the 10 s from sample start on
+    recording.markers['Time'][recording.markers['TypeID'] == recording.marker_ids['pushRed']]
+
+Print the summary of a recording with
+    python gtec_hdf5.py recording.hdf5
+"""
+
+from __future__ import division, print_function
+import sys
+import numbers
+import collections
+import xml.etree.ElementTree as ElementTree
+import numpy as np
+import h5py
+
+SAMPLES = 'RawData/Samples'
+ACQUISITION = 'RawData/AcquisitionTaskDescription'
+MARKER_TYPES = 'AsynchronData/AsynchronSignalTypes'
+MARKER_FIELDS = ('Time', 'TypeID', 'Value')
+BLOCK_SIZE = 65536  # samples per cached block
+CACHE_BLOCKS = 16  # blocks kept in memory
+
+
+def read_text(dataset):
+    """ The string stored in a dataset, which may be a scalar or an array of strings or bytes """
+    value = dataset[()]
+    if isinstance(value, np.ndarray):
+        value = b''.join(part if isinstance(part, bytes) else part.encode('utf-8') for part in value.ravel())
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def parse_value(text):
+    """ int, float, bool or the stripped text of an XML element """
+    text = (text or '').strip()
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    return {'true': True, 'false': False}.get(text.lower(), text)
+
+
+def element_to_dict(element):
+    """ The children of an XML element as a dict of their parsed text. Nested elements become dicts too. """
+    return dict((child.tag, element_to_dict(child) if len(child) else parse_value(child.text)) for child in element)
+
+
+def parse_descriptions(xml, tag, required):
+    """ element_to_dict of every element called tag which has a child called required, in document order """
+    root = ElementTree.fromstring(xml.encode('utf-8'))
+    return [element_to_dict(element) for element in root.iter(tag) if element.find(required) is not None]
+
+
+class BlockCache(object):
+    """ Reads rows of a 2D dataset in aligned blocks and keeps the cache_blocks most recently used """
+    def __init__(self, dataset, block_size=BLOCK_SIZE, cache_blocks=CACHE_BLOCKS):
+        self.dataset = dataset
+        self.block_size = block_size
+        self.cache_blocks = cache_blocks
+        self.blocks = collections.OrderedDict()
+
+    def block(self, idx):
+        if idx in self.blocks:
+            self.blocks[idx] = self.blocks.pop(idx)  # most recently used last
+        else:
+            self.blocks[idx] = self.dataset[idx*self.block_size:(idx + 1)*self.block_size]
+            if len(self.blocks) > self.cache_blocks:
+                self.blocks.popitem(last=False)
+        return self.blocks[idx]
+
+    def read(self, start, stop, columns=slice(None)):
+        """ rows start to stop (not included) of columns as an array """
+        if stop <= start:
+            return self.dataset[0:0, columns]
+        first, last = start // self.block_size, (stop - 1) // self.block_size
+        parts = [self.block(idx)[max(start - idx*self.block_size, 0):stop - idx*self.block_size, columns]
+                 for idx in range(first, last + 1)]
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+
+class Channel(object):
+    """
+    One channel of a Recording. Slicing (channel[start:stop]) returns the
+    samples as a 1D array, a view into the file if the samples are memory-mapped.
+    channel[i] is one sample. Negative i count from the end.
+    """
+    def __init__(self, recording, index):
+        self.recording = recording
+        self.index = index
+        self.name = recording.channel_names[index]
+        self.properties = recording.channel_properties[index]
+
+    def __len__(self):
+        return len(self.recording)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            return self.recording.read(start, stop, self.index)[::step]
+        index = key + len(self) if key < 0 else key  # like a sequence
+        if not 0 <= index < len(self):
+            raise IndexError('sample %i of channel %r, which has %i samples' % (key, self.name, len(self)))
+        return self.recording.read(index, index + 1, self.index)[0]
+
+    def __repr__(self):
+        return '<Channel %i %r of %s>' % (self.index, self.name, self.recording.path)
+
+
+class Recording(object):
+    """
+    A g.Recorder .hdf5 file. Parses the channel and marker descriptions and
+    the markers when opened. See the module docstring.
+
+    :fs: sampling frequency in Hz.
+    :channel_properties: list of dicts, one per channel, e.g. {'ChannelName': 'HEOG', ...}.
+    :channel_names: list of the ChannelNames.
+    :marker_types: list of dicts, one per AsynchronSignalDescription.
+    :marker_ids: dict of the Description (or Name if undescribed), e.g. 'pushRed', of each marker type to its ID.
+    :markers: dict of 'Time', 'TypeID' and 'Value' arrays, one entry per marker edge.
+    """
+    def __init__(self, path, block_size=BLOCK_SIZE, cache_blocks=CACHE_BLOCKS):
+        self.path = path
+        self.file = h5py.File(path, 'r')
+        self.samples = self.file[SAMPLES]
+
+        acquisition = read_text(self.file[ACQUISITION])
+        self.fs = parse_value(ElementTree.fromstring(acquisition.encode('utf-8')).find('.//SamplingFrequency').text)
+        self.channel_properties = parse_descriptions(acquisition, 'ChannelProperties', 'ChannelName')
+        self.channel_names = ['%s' % properties['ChannelName'] for properties in self.channel_properties]
+        if len(self.channel_names) != self.samples.shape[1]:
+            raise ValueError('%s describes %i channels but has samples of %i' % (path, len(self.channel_names), self.samples.shape[1]))
+
+        self.marker_types = []
+        self.markers = dict((field, np.zeros(0, dtype=int)) for field in MARKER_FIELDS)
+        if MARKER_TYPES in self.file:
+            self.marker_types = parse_descriptions(read_text(self.file[MARKER_TYPES]), 'AsynchronSignalDescription', 'ID')
+            self.markers = dict((field, np.asarray(self.file['AsynchronData/' + field][()]).ravel()) for field in MARKER_FIELDS)
+        self.marker_ids = dict((description.get('Description') or description.get('Name'), description['ID'])
+                               for description in self.marker_types)
+
+        self.memmap = self._memmap()
+        self.cache = BlockCache(self.samples, block_size, cache_blocks) if self.memmap is None else None
+
+    def _memmap(self):
+        """ The samples memory-mapped if they are stored contiguously and uncompressed, else None """
+        offset = self.samples.id.get_offset() if self.samples.chunks is None and not self.samples.compression else None
+        if offset is None:
+            return None
+        return np.memmap(self.path, dtype=self.samples.dtype, mode='r', offset=offset, shape=self.samples.shape)
+
+    def __len__(self):
+        """ Number of samples """
+        return self.samples.shape[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.memmap = None
+        self.cache = None
+        self.file.close()
+
+    def channel_index(self, channel):
+        """ Index of a channel given by name or index """
+        return self.channel_names.index(channel) if not isinstance(channel, numbers.Integral) else channel
+
+    def channel(self, channel):
+        """ Channel by name (e.g. 'HEOG') or index """
+        return Channel(self, self.channel_index(channel))
+
+    def read(self, start, stop, channels=None):
+        """
+        Samples start to stop (not included) of channels: an index or name
+        gives a 1D array, a sequence of them or None (all) a samples x channels array.
+        """
+        if channels is None:
+            columns = slice(None)
+        elif isinstance(channels, (list, tuple)):
+            columns = [self.channel_index(channel) for channel in channels]
+        else:
+            columns = self.channel_index(channels)
+        start, stop = max(start, 0), min(stop, len(self))
+        if self.memmap is not None:
+            return self.memmap[start:max(start, stop), columns]
+        return self.cache.read(start, stop, columns)
+
+    def windows(self, seconds, channels=None, start=0, stop=None):
+        """
+        Iterate over consecutive windows of seconds from sample start to stop
+        (the end by default). Yields (first sample, samples) like read(). The
+        last window may be shorter.
+        """
+        size = max(1, int(round(seconds * self.fs)))
+        stop = len(self) if stop is None else min(stop, len(self))
+        for first in range(start, stop, size):
+            yield first, self.read(first, min(first + size, stop), channels)
+
+
+def main(paths):
+    for path in paths:
+        with Recording(path) as recording:
+            print('%s: %i samples of %i channels at %g Hz (%.1f s), %s' % (
+                path, len(recording), len(recording.channel_names), recording.fs, len(recording) / recording.fs,
+                'memory-mapped' if recording.memmap is not None else 'chunked'))
+            print('channels: %s' % ', '.join(recording.channel_names))
+            counts = collections.Counter(recording.markers['TypeID'].tolist())
+            for description in recording.marker_types:
+                print('marker %s %r: %i edges' % (description['ID'], description.get('Description') or description.get('Name'),
+                                                  counts[description['ID']]))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -9,7 +9,20 @@ Created on Wed Apr  6 09:56:13 2016
 ####################
 import time
 import os
+import random
 import csv
+import atexit
+import signal
+import numbers
+import operator
+import itertools
+import threading
+import numpy as np
+import tools.columnar
+try:
+    import Queue as queue  # python 2
+except ImportError:
+    import queue
 
 #from tools import nasfiles # toto nie je treba RR
 from os import path
@@ -25,24 +38,106 @@ session = "1"
 
 
 
-from psychopy import event, core
-mouse = event.Mouse(visible=False)
+# Columns of a trial row in the order they are saved
+TRIAL_COLUMNS = (
+    # General session info
+    'trialId', 'expName', 'participant', 'date', 'session', 'frameRate',
+    # Trial info
+    'block', 'no_block', 'CueSide', 'CueCode', 'numTargets', 'numDistracts', 'Probe',
+    'Condition', 'ProbeCode', 'xys', 'oris', 'colors', 'targets', 'probe_id', 'probe_ori',
+    # Data
+    'ans', 'rt', 'responseFrame', 'response.corr', 'itiUTC', 'arrowUTC', 'soaUTC', 'memoryArrayUTC',
+    'retentionUTC', 'testArrayUTC', 'triggers'
+)
+
+# gTec Dig-I/O-2 channels wired to the LPT data pins, from the lowest bit up
+DIO2_CHANNELS = (5, 6, 7, 8)
+
+def make_dio2_to_lpt(channels=DIO2_CHANNELS):
+    """ Mapping from every combination of Dig-I/O-2 channels, e.g. (5, 7), to the LPT code which sets them """
+    table = {}
+    for n in range(1, len(channels) + 1):
+        for combination in itertools.combinations(channels, n):
+            table[combination] = sum(1 << channels.index(channel) for channel in combination)
+    return table
+
+DIO2_TO_LPT = make_dio2_to_lpt()
+
+def lpt_code(channels):
+    """ LPT code of a tuple of Dig-I/O-2 channels. Raises ValueError for channels which are not wired. """
+    key = tuple(sorted(channels))
+    if key not in DIO2_TO_LPT or len(set(key)) != len(key):
+        raise ValueError('%s is not a combination of the Dig-I/O-2 channels %s' % (channels, DIO2_CHANNELS))
+    return DIO2_TO_LPT[key]
+
+POLL_INTERVAL = 0.001  # seconds to sleep between polls of the mouse
+
+import tools.headless
+from psychopy import core
 clock = core.Clock()
 
-# Dummy parallel if it isn't present on this system
-# Nastavenie paraleleneho portu pre komunikaciu
-try:
-    from psychopy import parallel
-    parallel.setPortAddress(0x3FF8)
-    parallel.setData(0)
-except Exception as err:
-    print 'failed to use psychopy.parallel for the following reason:'
-    print err
-    class Parallel:
-        def setData(self, code):
-            #print 'just set parallel to %i' %code
-            pass
-    parallel = Parallel()
+
+class Lazy(object):
+    """
+    Stands in for the object returned by factory(), which is only called when
+    an attribute is first used. Keeps importing this module fast and lets the
+    mouse be created after the Window.
+    """
+    def __init__(self, factory):
+        self._factory = factory
+        self._obj = None
+
+    def __getattr__(self, name):
+        if self._obj is None:
+            self._obj = self._factory()
+        return getattr(self._obj, name)
+
+
+def open_parallel():
+    """ The parallel port, or a dummy if it isn't present on this system """
+    # Nastavenie paraleleneho portu pre komunikaciu
+    try:
+        parallel = tools.headless.psychopy_module('parallel')
+        parallel.setPortAddress(0x3FF8)
+        parallel.setData(0)
+        return parallel
+    except Exception as err:
+        print 'failed to use psychopy.parallel for the following reason:'
+        print err
+        class Parallel:
+            def setData(self, code):
+                #print 'just set parallel to %i' %code
+                pass
+        return Parallel()
+
+class Background(object):
+    """
+    Calls function(*args) in a daemon thread, e.g. to load the trials while
+    the Window opens. result() waits for it and returns what function
+    returned or raises what it raised.
+    """
+    def __init__(self, function, *args):
+        self.value = None
+        self.error = None
+        self.thread = threading.Thread(target=self._run, args=(function, args))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self, function, args):
+        try:
+            self.value = function(*args)
+        except Exception as err:
+            self.error = err
+
+    def result(self):
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+event = Lazy(lambda: tools.headless.psychopy_module('event'))
+mouse = Lazy(lambda: event.Mouse(visible=False))  # psychopy needs a Window for this
+parallel = Lazy(open_parallel)
 
 #########################
 # Functions and classes #
@@ -59,8 +154,8 @@ def waitMousePressed(maxWait=float('inf'), keyList=[0,1,2], timeStamped=False, k
     """
     # Do not collect responses before this time has passed
     clock.reset()
-    while clock.getTime() < responseStart:
-        pass
+    if responseStart > 0:
+        core.wait(responseStart, hogCPUperiod=0)
 
     mouse.clickReset()
     mouse.mouseClock.reset()
@@ -70,12 +165,104 @@ def waitMousePressed(maxWait=float('inf'), keyList=[0,1,2], timeStamped=False, k
             if response is not None and response != (None, None):
                 if keyEvent == 'release':
                     while getMousePressed(keyList) is not None:  # wait for mouse release
-                        pass
+                        core.wait(POLL_INTERVAL, hogCPUperiod=0)
                 return response
+            core.wait(POLL_INTERVAL, hogCPUperiod=0)  # sleep instead of spinning. Press times are stamped by the event handler anyway
         # Return None when maxWait is exceeded
         else:
             return (None, None) if timeStamped else None
 
+class ResponseCapture(object):
+    """
+    Collects mouse button presses with their timestamps, without spinning the CPU.
+
+    Uses the iohub event queue, where every press carries the time the
+    operating system registered it, if iohub can be started. Otherwise it uses
+    the press times recorded by psychopy's mouse event handlers. Either way the
+    RT does not depend on how often the presses are polled.
+    With device='keyboard', presses of the keys in keys are collected from
+    psychopy's timestamped keyboard buffer instead (e.g. for the cedrus
+    keyboard). Other keys stay in the buffer, e.g. for quitting.
+
+    Usage:
+        flip_time = win.flip()
+        responses.start(flip_time)
+        ...
+        button, rt = responses.first(keyList)  # non-blocking. (None, None) if no press yet
+        button, rt = responses.wait(keyList, maxWait)  # or block, sleeping between polls
+    """
+    IOHUB_BUTTONS = {'MOUSE_BUTTON_LEFT': 0, 'MOUSE_BUTTON_MIDDLE': 1, 'MOUSE_BUTTON_RIGHT': 2}
+
+    def __init__(self, mouse=mouse, use_iohub=not tools.headless.HEADLESS, device='mouse', keys=None):
+        self.mouse = mouse
+        self.device = device
+        self.keys = keys
+        self.io_mouse = None
+        if use_iohub and device == 'mouse':
+            try:
+                try:
+                    from psychopy.iohub.client import launchHubServer
+                except ImportError:
+                    from psychopy.iohub import launchHubServer
+                from psychopy.iohub.constants import EventConstants, MouseConstants
+                self.io = launchHubServer()
+                self.io_mouse = self.io.devices.mouse
+                self.press_type = EventConstants.MOUSE_BUTTON_PRESS
+                self.io_buttons = dict((getattr(MouseConstants, name), button) for name, button in self.IOHUB_BUTTONS.items())
+            except Exception as err:
+                print 'failed to use iohub for responses for the following reason:'
+                print err
+        self.onset = 0
+        self.presses = []  # (button, rt) in order of occurence
+
+    def start(self, onset):
+        """ Forget earlier presses. RTs are relative to onset, e.g. the return value of win.flip(). """
+        self.onset = onset
+        self.presses = []
+        if self.device == 'keyboard':
+            event.getKeys(keyList=self.keys)  # discard earlier presses
+        elif self.io_mouse is not None:
+            self.io_mouse.clearEvents()
+        else:
+            self.mouse.clickReset()
+            self.reset_time = core.getTime()
+
+    def poll(self):
+        """ Collect new presses. Returns the list of all presses since start as (button, rt). """
+        if self.device == 'keyboard':
+            for key, time in event.getKeys(keyList=self.keys, timeStamped=core.monotonicClock):  # same clock as win.flip()
+                self.presses.append((key, time - self.onset))
+        elif self.io_mouse is not None:
+            for press in self.io_mouse.getEvents(event_type=self.press_type):
+                if press.button_id in self.io_buttons:
+                    self.presses.append((self.io_buttons[press.button_id], press.time - self.onset))
+        else:
+            buttons, times = self.mouse.getPressed(getTime=True)
+            seen = [button for button, rt in self.presses]
+            for button in range(len(buttons)):
+                if buttons[button] and times[button] > 0 and button not in seen:
+                    self.presses.append((button, self.reset_time + times[button] - self.onset))
+            self.presses.sort(key=lambda press: press[1])
+        return self.presses
+
+    def first(self, keyList=(0, 1, 2)):
+        """ (button, rt) of the first press of a button in keyList since start. (None, None) if none. Does not block. """
+        for button, rt in self.poll():
+            if button in keyList:
+                return button, rt
+        return None, None
+
+    def wait(self, keyList=(0, 1, 2), maxWait=float('inf')):
+        """ Like first, but waits up to maxWait seconds for a press, sleeping POLL_INTERVAL between polls. """
+        end_time = core.getTime() + maxWait
+        while True:
+            button, rt = self.first(keyList)
+            remaining = end_time - core.getTime()
+            if button is not None or remaining <= 0:
+                return button, rt
+            core.wait(min(POLL_INTERVAL, remaining), hogCPUperiod=0)  # also dispatches window events
+
+
 def getMousePressed(keyList=[0,1,2], timeStamped=False):
     buttons, times = mouse.getPressed(getTime=True)  # get mouse presses
     for button in keyList:  # match presses with keyList
@@ -115,25 +302,373 @@ def get_start_info(win):
     return return_dict
 
 
+def prepare_trials(trial_list, start_info, exp_name, cue_codes, shuffle=random.shuffle):
+    """
+    Shuffle the trials within every block, number them within the block and
+    flatten the blocks into one list. Adds the session info to every trial.
+
+    :trial_list: list of blocks, each a list of trial dicts.
+    :start_info: dict from get_start_info with 'save_file_name' added.
+    :exp_name: str. Saved as 'expName'.
+    :cue_codes: dict of CueSide to the trigger code saved as 'CueCode'.
+    """
+    prepared_trial_list = []
+    for current_block in trial_list:
+        shuffle(current_block)
+        # append no within block
+        for no, trial in enumerate(current_block):
+            trial['no_block'] = no + 1
+            
+        prepared_trial_list.extend(current_block)
+
+    # then include additional info
+    for trial in prepared_trial_list:
+        trial['date'] = start_info['start_time']
+        trial['session'] = start_info['session']
+        trial['frameRate'] = start_info['frame_rate']
+        trial['expName'] = exp_name
+        trial['participant'] = start_info['save_file_name']
+        trial['CueCode'] = cue_codes[trial['CueSide']]
+        
+    return prepared_trial_list
+
+
 
 # Timing
+def anchor_clocks():
+    """
+    (UTC, monotonic) pair read at the same moment, both in integer ns.
+    Waits for the next tick of the system clock, which only ticks every ~16 ms
+    on some Windows systems, so the pair is exact to the monotonic clock's precision.
+    """
+    start = time.time()
+    utc = time.time()
+    while utc == start:
+        utc = time.time()
+    return int(round(utc * 10**9)), int(round(core.getTime() * 10**9))
+
+UTC_ANCHOR = anchor_clocks()  # taken once at session start. All UTC times are mapped from core.getTime() through it
+
+def monotonic_to_utc_ns(monotonic_ns):
+    """ UTC ns since the epoch of a core.getTime() reading in ns. Also works on integer arrays. """
+    return UTC_ANCHOR[0] + (monotonic_ns - UTC_ANCHOR[1])
+
 def get_utc(return_format='%Y-%m-%dT%H:%M:%S.%fZ'):
     """
-    Get current time with millisecond precision.
-    return_format can be 'unix' or a datetime.datetime.strftime format.
+    Get current time with microsecond precision.
+    return_format can be 'unix' (seconds since the epoch) or a datetime.datetime.strftime format.
     """
+    utc_ns = monotonic_to_utc_ns(int(round(core.getTime() * 10**9)))
     if return_format == 'unix':
-        return (datetime.now() - datetime.utcfromtimestamp(0)).total_seconds()
+        return utc_ns / 1e9
     else:
-        return datetime.strftime(datetime.utcnow(), return_format)
+        return utc_string(utc_ns, return_format)
 
 def record_utc(trial, key, return_format='%Y-%m-%dT%H:%M:%S.%fZ'):
-    """ Useful for win.callOnFlip(record_rt, trial, 'time_key') """
+    """ Useful for win.callOnFlip(record_rt, trial, 'time_key'). EventLog.stamp is cheaper on flips. """
     trial[key] = get_utc(return_format)  # cross platform
 
 
+# Records of EventLog: monotonic (core.getTime) and UTC time in integer nanoseconds, event code and trial id
+EVENT_DTYPE = np.dtype([('monotonic_ns', '<i8'), ('utc_ns', '<i8'), ('code', '<i4'), ('trial', '<i4')])
+ANCHOR_EVENT = 0  # the UTC_ANCHOR the UTC times of a file were mapped with
+EVENT_CODES = {'itiUTC': 1, 'arrowUTC': 2, 'soaUTC': 3, 'memoryArrayUTC': 4, 'retentionUTC': 5, 'testArrayUTC': 6}  # phase onsets
+TRIGGER_EVENT = 256  # setting the parallel port to code is logged as TRIGGER_EVENT + code, so clearing it as TRIGGER_EVENT
+
+def utc_string(utc_ns, return_format='%Y-%m-%dT%H:%M:%S.%fZ'):
+    """ Format a UTC time in nanoseconds since the epoch like get_utc """
+    return datetime.strftime(datetime.utcfromtimestamp(utc_ns // 10**9).replace(microsecond=utc_ns % 10**9 // 1000), return_format)
+
+class EventLog(object):
+    """
+    Binary log of (monotonic ns, utc ns, code, trial id) events for aligning
+    with the EEG amplifier's markers offline. Events go into a preallocated
+    buffer which a background thread appends to the file every
+    flush_interval seconds, so recording one costs one clock read and no
+    string formatting or disk I/O. The UTC times are mapped from the
+    monotonic ones when flushing, through UTC_ANCHOR, which is logged as
+    the first event (code ANCHOR_EVENT). Read the file with read_events.
+
+    Usage:
+        events = EventLog('results/session.events')
+        trial['trialId'] = events.start_trial()
+        win.callOnFlip(events.stamp, trial, 'itiUTC')  # instead of record_utc
+        ...
+        events.format_utc(trial)  # before saving the trial
+    """
+    def __init__(self, path, size=65536, flush_interval=0.5):
+        """
+        :path: str. The sidecar file. Events are appended.
+        :size: int. Number of events buffered. Flushes on the recording thread if exceeded.
+        :flush_interval: float. Seconds between flushes.
+        """
+        self.path = path
+        self.size = size
+        self.buffer = np.zeros(size, dtype=EVENT_DTYPE)
+        self.n = 0  # events recorded in total
+        self.flushed = 0  # events written to the file
+        self.trial = 0
+        self.lock = threading.Lock()
+        self.file_object = open(path, 'ab')
+        self.buffer[0] = (UTC_ANCHOR[1], UTC_ANCHOR[0], ANCHOR_EVENT, 0)
+        self.n = 1
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(flush_interval, ))
+        self.thread.daemon = True  # close() is called on exit instead
+        self.thread.start()
+        atexit.register(self.close)
+
+    def start_trial(self):
+        """ Events from now on belong to the next trial. Returns its id (1, 2, ...). """
+        self.trial += 1
+        return self.trial
+
+    def record(self, code):
+        """ Log an event of the current trial now. Returns its monotonic ns. """
+        if self.n - self.flushed >= self.size:
+            self.flush()  # the flush thread fell behind
+        monotonic_ns = int(core.getTime() * 10**9)
+        self.buffer[self.n % self.size] = (monotonic_ns, 0, code, self.trial)
+        self.n += 1
+        return monotonic_ns
+
+    def stamp(self, trial, key):
+        """ Log the EVENT_CODES[key] event and keep its monotonic ns in trial[key]. Useful for win.callOnFlip. """
+        trial[key] = self.record(EVENT_CODES[key])
+
+    def format_utc(self, trial, return_format='%Y-%m-%dT%H:%M:%S.%fZ'):
+        """ Turn the times stamped into trial into UTC strings like record_utc does. Call this outside of time-critical frames. """
+        for key in EVENT_CODES:
+            if isinstance(trial.get(key), numbers.Integral):
+                trial[key] = utc_string(monotonic_to_utc_ns(trial[key]), return_format)
+
+    def flush(self):
+        """ Append the events recorded since the last flush to the file """
+        with self.lock:
+            end = self.n
+            start = self.flushed
+            while start < end:
+                chunk_end = min(end, start - start % self.size + self.size)  # up to the end of the ring buffer
+                chunk = self.buffer[start % self.size:(chunk_end - 1) % self.size + 1]
+                chunk['utc_ns'] = monotonic_to_utc_ns(chunk['monotonic_ns'])
+                chunk.tofile(self.file_object)
+                start = chunk_end
+            self.file_object.flush()
+            self.flushed = end
+
+    def _run(self, flush_interval):
+        while not self.stopped.wait(flush_interval):
+            self.flush()
+
+    def close(self):
+        """ Write all events and stop the thread. Called automatically on exit. """
+        if not self.stopped.is_set():
+            self.stopped.set()
+            self.thread.join()
+            self.flush()
+            self.file_object.close()
+
+
+def read_events(path):
+    """ Structured array (EVENT_DTYPE) of the events in a file written by EventLog. An incomplete last event is dropped. """
+    n = os.path.getsize(path) // EVENT_DTYPE.itemsize
+    return np.fromfile(path, dtype=EVENT_DTYPE, count=n)
+
+
+class TriggerScheduler(object):
+    """
+    Sends triggers on the parallel port on given flips and clears them a given
+    number of frames later. Every setData happens in a callOnFlip hook, so
+    trial code never sleeps to time a pulse. Pass it to FrameTimer, which
+    calls before_flip on every flip and start_trial on every trial.
+    Every write to the port is also logged in events (an EventLog) if given.
+
+    Usage:
+        frame_timer.start_trial()
+        triggers.schedule(code, onset_flip, width_frames)  # flips counted from the first flip of the trial
+        ... run the trial using frame_timer.flip ...
+        trial['triggers'] = triggers.log  # [code, onset_flip, set time, clear time] per trigger
+    """
+    def __init__(self, win, port=parallel, events=None):
+        self.win = win
+        self.port = port
+        self.events = events
+        self.n = 0  # flips lined up in total
+        self.trial_start = 0
+        self.pending = {}  # absolute flip: (code, width_frames)
+        self.clears = {}  # absolute flip: log entry of the trigger to clear
+        self.busy = []  # (first flip, end flip) of every scheduled trigger which has not ended yet
+        self.log = []
+
+    def start_trial(self):
+        """ Count flips from the next flip on and start a new log. Triggers still on are cleared as scheduled. """
+        self.trial_start = self.n
+        self.log = []
+
+    def next_flip(self):
+        """ Flip number (within the trial) of the coming flip, e.g. to send a trigger as soon as possible """
+        return self.n - self.trial_start
+
+    def schedule(self, code, onset_flip, width_frames=1):
+        """
+        Set the parallel port to code on flip number onset_flip of the trial
+        and back to 0 width_frames flips later.
+        Raises ValueError for invalid codes, past flips and overlapping triggers.
+        """
+        if not isinstance(code, numbers.Integral) or not 0 < code < 256:
+            raise ValueError('trigger code must be an int from 1 to 255, not %r' % (code, ))
+        if width_frames < 1:
+            raise ValueError('trigger width must be at least one frame, not %r' % (width_frames, ))
+        first = self.trial_start + onset_flip
+        end = first + width_frames
+        if first < self.n:
+            raise ValueError('flip %i of this trial has already been shown' % onset_flip)
+        self.busy = [(busy_first, busy_end) for busy_first, busy_end in self.busy if busy_end > self.n]
+        for busy_first, busy_end in self.busy:
+            if first < busy_end and busy_first < end:
+                raise ValueError('trigger %i on flips %i to %i overlaps another trigger' % (code, onset_flip, onset_flip + width_frames - 1))
+        self.busy.append((first, end))
+        self.pending[first] = (code, width_frames)
+
+    def before_flip(self):
+        """ Line up the triggers to set and clear on the coming flip. Call this right before every win.flip(). """
+        clear = self.clears.pop(self.n, None)
+        if self.n in self.pending:
+            code, width_frames = self.pending.pop(self.n)
+            entry = [code, self.n - self.trial_start, None, None]
+            self.log.append(entry)
+            self.clears[self.n + width_frames] = entry
+            self.win.callOnFlip(self._set, entry, clear)  # replaces a trigger ending on this flip without going through 0
+        elif clear is not None:
+            self.win.callOnFlip(self._clear, clear)
+        self.n += 1
+
+    def _set(self, entry, replaced=None):
+        self.port.setData(entry[0])
+        entry[2] = core.getTime()
+        if self.events is not None:
+            self.events.record(TRIGGER_EVENT + entry[0])
+        if replaced is not None:
+            replaced[3] = entry[2]
+
+    def _clear(self, entry):
+        self.port.setData(0)
+        entry[3] = core.getTime()
+        if self.events is not None:
+            self.events.record(TRIGGER_EVENT)
+
+
+class FrameTimer(object):
+    """
+    Records the time of every flip and the trial phase it belongs to in a
+    preallocated ring buffer. Use FrameTimer.flip instead of win.flip in the
+    trial loops and add FrameTimer.summary to the trial before saving it.
+    """
+    def __init__(self, win, frame_rate, phases=('ITI', 'cue', 'SOA', 'array1', 'retention', 'probe'), size=4096, triggers=None):
+        """
+        :win: the psychopy Window to flip.
+        :frame_rate: int. Frames per second.
+        :phases: names of the phases in the order they appear in a trial.
+        :size: int. Number of flips kept. Must exceed the flips of one trial.
+        :triggers: TriggerScheduler or None. Gets to line up its triggers before every flip.
+        """
+        self.win = win
+        self.triggers = triggers
+        self.frame_rate = frame_rate
+        self.phases = phases
+        self.phase_codes = dict((phase, code) for code, phase in enumerate(phases))
+        self.size = size
+        self.times = np.zeros(size)
+        self.codes = np.zeros(size, dtype=np.int8)
+        self.n = 0  # flips recorded in total
+        self.trial_start = 0
+
+    def columns(self):
+        """ Keys of summary, e.g. to extend TRIAL_COLUMNS """
+        return tuple(phase + key for phase in self.phases for key in ('Ms', 'Dropped'))
+
+    def start_trial(self):
+        """ Only flips from here on count for the next summary """
+        self.trial_start = self.n
+        if self.triggers is not None:
+            self.triggers.start_trial()
+
+    def flip(self, phase):
+        """ win.flip() and record its time under phase. Returns the flip time. """
+        if self.triggers is not None:
+            self.triggers.before_flip()
+        flip_time = self.win.flip()
+        self.times[self.n % self.size] = flip_time
+        self.codes[self.n % self.size] = self.phase_codes[phase]
+        self.n += 1
+        return flip_time
+
+    def summary(self, durations, end_time, paced=()):
+        """
+        Duration of each phase of the current trial, from its first flip to the
+        first flip of the next phase (end_time for the last phase).
+        Returns a dict with '<phase>Ms', the actual duration in ms, and
+        '<phase>Dropped', the number of frames the phase lasted longer than
+        durations[phase] (negative if it was cut short). Phases in paced last
+        until the subject advances, so their Dropped is ''.
+        If the trial had more than size flips, e.g. a paced phase waiting long
+        for the subject, its first flips were overwritten. The phases up to
+        the oldest one kept are then missing ('').
+        """
+        first = max(self.trial_start, self.n - self.size)
+        idx = np.arange(first, self.n) % self.size
+        codes = self.codes[idx]
+        onsets = [(code, idx[pos]) for pos, code in enumerate(codes) if (pos == 0 and first == self.trial_start) or (pos > 0 and code != codes[pos - 1])]
+        summary = {}
+        if first > self.trial_start:
+            for phase in self.phases[:codes[0] + 1]:  # started before the oldest flip kept
+                summary[phase + 'Ms'] = summary[phase + 'Dropped'] = ''
+        for i, (code, onset_idx) in enumerate(onsets):
+            phase = self.phases[code]
+            offset = self.times[onsets[i + 1][1]] if i + 1 < len(onsets) else end_time
+            actual = float(offset - self.times[onset_idx])
+            summary[phase + 'Ms'] = round(1000 * actual, 1)
+            summary[phase + 'Dropped'] = int(round(actual * self.frame_rate)) - durations[phase] if phase not in paced else ''
+        return summary
+
+
+class RowSchema(object):
+    def __init__(self, columns, extra='raise'):
+        """
+        Turns trial dicts into rows with a fixed column order.
+
+        :columns: sequence of str. The keys to save, in order. Missing keys are saved as ''.
+        :extra: what to do with keys which are not in columns. 'raise' a ValueError,
+            'ignore' them or 'extend' the row with a last column 'extra' holding key=value pairs.
+        """
+        if extra not in ('raise', 'ignore', 'extend'):
+            raise ValueError("extra must be 'raise', 'ignore' or 'extend', not %r" % extra)
+        self.columns = tuple(columns)
+        self.extra = extra
+        self.header = self.columns + ('extra', ) if extra == 'extend' else self.columns
+        self._known = frozenset(self.columns)
+        self._getter = operator.itemgetter(*self.columns)  # all values in one C call
+        if len(self.columns) == 1:
+            getter = self._getter
+            self._getter = lambda trial: (getter(trial), )
+
+    def row(self, trial):
+        """ List of the values of trial in column order """
+        unknown = () if self._known.issuperset(trial) else sorted(set(trial) - self._known)
+        if unknown and self.extra == 'raise':
+            raise ValueError('trial has keys which are not in the columns: %s' % ', '.join(unknown))
+        try:
+            values = list(self._getter(trial))
+        except KeyError:
+            values = [trial.get(column, '') for column in self.columns]
+        if self.extra == 'extend':
+            values.append(';'.join('%s=%s' % (key, trial[key]) for key in unknown))
+        return values
+
+
 class csvWriter(object):
-    def __init__(self, prefix='', folder='', save_immediately=False, add_timestamp=False, delimiter='|'):
+    def __init__(self, prefix='', folder='', save_immediately=False, add_timestamp=False, delimiter='|', columns=None, extra='raise',
+                 columnar=False):
         """
         Creates a csv file and appends single rows to it using the csvWriter.write() function.
         Use this function to save trials. Writes a row in less than a millisecond.
@@ -143,8 +678,13 @@ class csvWriter(object):
         :save_immediately: bool. whether to save to disk on each row (crash-safe but 2-3x) or flush on script exit (risk of data-loss on crash but 2-3x faster)
         :add_timestamp: bool. whether to add a timestamp as postfix to the file. Good to prevent overwriting!
         :delimiter: str. What to use as column delimiter in the save file.
+        :columns: sequence of str. Fixed column order, e.g. TRIAL_COLUMNS. If None, the keys of the first trial are used.
+        :extra: how to treat keys which are not in columns. See RowSchema.
+        :columnar: bool. Also save the session as typed columns (see tools.columnar) when python exits. Requires columns.
         """
         self.delimiter = delimiter
+        self.schema = RowSchema(columns, extra) if columns is not None else None
+        self.columnar = _session_columns(self.schema, columnar)
         #print prefix 
         #print self 
         # Create folder if it doesn't exist
@@ -162,6 +702,8 @@ class csvWriter(object):
         else:
             self.writer = self._writer_immediate
         self.headerWritten = False
+        if self.columnar:
+            atexit.register(self.close)
 
     def _write_immediate(self, trial):
         """
@@ -173,12 +715,13 @@ class csvWriter(object):
         """
         #print 'pisem do suboru'
         #tsC = core.getTime()
+        row = self._row(trial)
         with open(self.saveFile, 'a') as file_object:
             if not self.headerWritten:
                 self.headerWritten = True
-                csv.writer(file_object, delimiter='|').writerow(trial.keys())
+                csv.writer(file_object, delimiter='|').writerow(self._header(trial))
                 #csv.writer(file_object, delimiter=',').writerow(trial.keys())
-            csv.writer(file_object, delimiter='|').writerow(trial.values())
+            csv.writer(file_object, delimiter='|').writerow(row)
             #csv.writer(file_object, delimiter=',').writerow(trial.values())
         #print 'Writing time :', core.getTime() - tsC
 
@@ -191,7 +734,172 @@ class csvWriter(object):
         :trial: a dictionary"""
         # print 'pisem do suboru'
         # print trial
+        row = self._row(trial)
         if not self.headerWritten:
             self.headerWritten = True
-            self.writer(trial.keys())
-        self.writer(trial.values())
\ No newline at end of file
+            self.writer(self._header(trial))
+        self.writer(row)
+
+    def close(self):
+        """ Save the typed columns if columnar. Called automatically on exit. """
+        if self.columnar:
+            self.columnar.save(os.path.splitext(self.saveFile)[0] + '.npz')
+            self.columnar = None
+
+    def _header(self, trial):
+        return self.schema.header if self.schema else trial.keys()
+
+    def _row(self, trial):
+        if not self.schema:
+            return trial.values()
+        row = self.schema.row(trial)
+        if self.columnar:
+            self.columnar.append(row)
+        return row
+
+
+def _session_columns(schema, columnar):
+    """ tools.columnar.SessionColumns for the writers if columnar """
+    if not columnar:
+        return None
+    if schema is None:
+        raise ValueError('columnar output needs fixed columns')
+    return tools.columnar.SessionColumns(schema.header)
+
+
+class BackgroundWriter(object):
+    def __init__(self, prefix='', folder='', add_timestamp=False, delimiter='|', queue_size=1000, fsync_interval=1.0,
+                 columns=None, extra='raise', columnar=False):
+        """
+        Like csvWriter but rows are written by a background thread, so write()
+        only puts the trial on a queue and never waits for the disk unless
+        queue_size trials are pending.
+
+        Every row is appended and flushed to the operating system as soon as it
+        is dequeued, so a crash of python loses no completed trial. The file is
+        additionally fsync'ed at most every fsync_interval seconds, which
+        protects against power loss without paying for a sync per trial.
+        Pending rows are written on exit, also on SIGTERM. Use read_rows to
+        read a file whose last line may have been cut off by a crash.
+        If the thread fails, e.g. the disk is full, the next write() or
+        close() raises its error instead of waiting for it.
+
+        :prefix: str. The prefix to the file name.
+        :folder: str. If empty, uses same directory as the py file
+        :add_timestamp: bool. whether to add a timestamp as postfix to the file. Good to prevent overwriting!
+        :delimiter: str. What to use as column delimiter in the save file.
+        :queue_size: int. Maximum number of trials waiting to be written.
+        :fsync_interval: float. Maximum seconds between fsyncs.
+        :columns: sequence of str. Fixed column order, e.g. TRIAL_COLUMNS. If None, the keys of the first trial are used.
+        :extra: how to treat keys which are not in columns. See RowSchema.
+        :columnar: bool. Also save the session as typed columns (see tools.columnar) when closed. Requires columns.
+        """
+        self.delimiter = delimiter
+        self.schema = RowSchema(columns, extra) if columns is not None else None
+        self.columnar = _session_columns(self.schema, columnar)
+        self.fsync_interval = fsync_interval
+        if folder:
+            folder += '/'
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+        self.saveFile = folder + str(prefix)
+        if add_timestamp:
+            self.saveFile += ' (' + time.strftime('%Y-%m-%d %H-%M-%S', time.localtime()) +').csv'
+        self.headerWritten = False
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.closed = False
+        self.error = None  # what stopped the thread
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True  # close() is called on exit instead
+        self.thread.start()
+        atexit.register(self.close)
+        try:
+            self._previous_sigterm = signal.signal(signal.SIGTERM, self._on_sigterm)
+        except ValueError:  # not in the main thread
+            self._previous_sigterm = None
+
+    def write(self, trial):
+        """ Queue a row. The row is built here, so the trial can be changed afterwards. :trial: a dictionary """
+        if self.closed:
+            raise ValueError('write to closed BackgroundWriter %s' % self.saveFile)
+        if self.schema:
+            self._put((self.schema.header, self.schema.row(trial)))
+        else:
+            self._put((list(trial.keys()), list(trial.values())))
+
+    def _put(self, item):
+        """ Queue item, waiting while the queue is full. Raises the error of the thread if it stopped. """
+        while True:
+            if not self.thread.is_alive():
+                raise self.error or IOError('the writer thread of %s has stopped' % self.saveFile)
+            try:
+                self.queue.put(item, timeout=self.fsync_interval)
+                return
+            except queue.Full:
+                pass
+
+    def _run(self):
+        """ Writer thread. Keeps what stopped it in self.error. """
+        try:
+            self._write_rows()
+        except Exception as err:
+            self.error = err
+
+    def _write_rows(self):
+        """ Append rows, flush each and fsync in batches. None on the queue stops it. """
+        with open(self.saveFile, 'a') as file_object:
+            writer = csv.writer(file_object, delimiter=self.delimiter)
+            last_sync = time.time()
+            unsynced = False
+            while True:
+                try:
+                    item = self.queue.get(timeout=self.fsync_interval)
+                except queue.Empty:
+                    item = False  # nothing to write. Just sync.
+                if item:
+                    header, row = item
+                    if not self.headerWritten:
+                        self.headerWritten = True
+                        writer.writerow(header)
+                    writer.writerow(row)
+                    if self.columnar:
+                        self.columnar.append(row)
+                    file_object.flush()  # now in the OS, safe from python crashes
+                    unsynced = True
+                if unsynced and (item is None or time.time() - last_sync >= self.fsync_interval):
+                    os.fsync(file_object.fileno())  # now on disk, safe from power loss
+                    last_sync = time.time()
+                    unsynced = False
+                if item is None:
+                    break
+        if self.columnar:
+            self.columnar.save(os.path.splitext(self.saveFile)[0] + '.npz')
+
+    def close(self):
+        """ Write all pending rows and stop the thread. Called automatically on exit. """
+        if not self.closed:
+            self.closed = True
+            self._put(None)
+            self.thread.join()
+            if self.error is not None:
+                raise self.error
+
+    def _on_sigterm(self, signum, frame):
+        self.close()
+        if callable(self._previous_sigterm):
+            self._previous_sigterm(signum, frame)
+        else:
+            raise SystemExit(128 + signum)
+
+
+def read_rows(save_file, delimiter='|'):
+    """
+    Read a file written by csvWriter or BackgroundWriter, e.g. after a crash.
+    Returns (header, rows). A last line which was cut off during writing is dropped.
+    """
+    with open(save_file) as file_object:
+        lines = file_object.read().split('\n')
+    complete = lines[:-1]  # the part after the last newline is empty or incomplete
+    rows = list(csv.reader(complete, delimiter=delimiter))
+    return (rows[0], rows[1:]) if rows else ([], [])
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+This module saves the trials of a session as typed NumPy columns (.npz),
+next to the pipe-delimited csv.
+
+In the csv, xys, oris, colors, targets and triggers are stringified python
+lists which every analysis has to parse again row by row. Here every scalar column is one
+int, float (NaN for missing) or text array, and every ragged column is stored
+natively as its concatenated values plus '<column>_offsets', so that the
+values of trial i are values[offsets[i]:offsets[i + 1]].
+
+Usage:
+    session = load_session('results/XX 01 CDA 1 C01-LKE-D1 ....npz')
+    cohort = load_sessions(glob.glob('results/*.npz'))  # one vectorized table
+"""
+
+from __future__ import division
+import numbers
+import numpy as np
+
+RAGGED_COLUMNS = ('xys', 'oris', 'colors', 'targets', 'triggers')
+
+try:
+    text_type = unicode  # python 2
+except NameError:
+    text_type = str
+
+
+def typed_array(values):
+    """
+    int array if all values are integers, float array if all are numbers or
+    missing ('' or None become NaN) and a text array otherwise.
+    """
+    missing = [value is None or (isinstance(value, (str, text_type)) and value == '') for value in values]
+    present = [value for value, is_missing in zip(values, missing) if not is_missing]
+    if all(isinstance(value, (numbers.Number, np.number)) for value in present):
+        if not any(missing) and all(isinstance(value, (numbers.Integral, np.integer)) for value in present):
+            return np.array(values, dtype=np.int64)
+        return np.array([np.nan if is_missing else value for value, is_missing in zip(values, missing)], dtype=float)
+    return np.array([value if isinstance(value, (str, text_type)) else text_type(value) for value in values])
+
+
+def ragged_array(values):
+    """ (concatenated values, offsets) of a list of sequences. '' counts as empty. """
+    values = [[] if isinstance(value, (str, text_type)) and value == '' else value for value in values]
+    offsets = np.cumsum([0] + [len(value) for value in values])
+    flat = [item for value in values for item in value]
+    return (typed_array(flat) if flat and np.ndim(flat[0]) == 0 else np.array(flat, dtype=float)), offsets
+
+
+class SessionColumns(object):
+    """ Collects rows in column order (see stimsoft_common.RowSchema) and saves them as .npz """
+    def __init__(self, columns, ragged=RAGGED_COLUMNS):
+        self.columns = tuple(columns)
+        self.ragged = ragged
+        self.values = [[] for column in self.columns]
+
+    def append(self, row):
+        for column_values, value in zip(self.values, row):
+            column_values.append(value)
+
+    def arrays(self):
+        arrays = {'_columns': np.array(self.columns)}
+        for column, values in zip(self.columns, self.values):
+            if column in self.ragged:
+                arrays[column], arrays[column + '_offsets'] = ragged_array(values)
+            else:
+                arrays[column] = typed_array(values)
+        return arrays
+
+    def save(self, path):
+        np.savez(path, **self.arrays())
+
+
+def load_session(path):
+    """ dict of column name to array """
+    with np.load(path) as data:
+        return dict((name, data[name]) for name in data.files)
+
+
+def n_trials(session):
+    """ Number of trials in a loaded session """
+    column = session['_columns'][0]
+    return len(session[column + '_offsets']) - 1 if column + '_offsets' in session else len(session[column])
+
+
+def load_sessions(paths):
+    """
+    Concatenate sessions into one dict of arrays. Ragged offsets are shifted
+    accordingly and 'file_idx' holds the index into paths of every trial.
+    """
+    sessions = [load_session(path) for path in paths]
+    arrays = {'file_idx': np.concatenate([np.full(n_trials(session), idx, dtype=int) for idx, session in enumerate(sessions)])}
+    for name in sessions[0]:
+        if name == '_columns':
+            arrays[name] = sessions[0][name]
+        elif name.endswith('_offsets'):
+            starts = np.cumsum([0] + [session[name][-1] for session in sessions[:-1]])
+            arrays[name] = np.concatenate([[0]] + [session[name][1:] + start for session, start in zip(sessions, starts)])
+        else:
+            arrays[name] = np.concatenate([session[name] for session in sessions])
+    return arrays
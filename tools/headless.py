@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+This module lets the task scripts run without a screen, mouse, keyboard,
+dialogs or parallel port, e.g. to run whole trial lists unattended on a
+build machine and check their frame and trigger timing.
+
+Set the environment variable CDA_HEADLESS before starting a script:
+ * CDA_HEADLESS=1: flips are paced at the frame rate like on a real monitor
+   and a simulated subject clicks the mouse.
+ * CDA_HEADLESS=fast: flips return immediately. Trials run as fast as python
+   can prepare the frames, which is what per-frame CPU benchmarks need. The
+   simulated subject is then too slow to answer within the probe.
+If CDA_HEADLESS_LOG is set to a path, the flips (time, stimuli drawn, time
+spent preparing the frame) and the parallel port writes (time, code) are
+saved there as .npz when python exits.
+Dialogs are answered with the first choice of every field or
+CDA_HEADLESS_TEXT ('1' by default). CDA_HEADLESS_DIALOG can be a JSON list
+of answers instead.
+
+psychopy_module('visual') etc. returns the psychopy module or, in headless
+mode, its stand-in, which lets scripts import psychopy only when needed.
+
+Only psychopy.core is needed. Stimuli are stand-ins which keep the
+attributes they are given and count how often they are drawn.
+"""
+
+from __future__ import division
+import os
+import sys
+import json
+import importlib
+import atexit
+import numpy as np
+from psychopy import core
+
+MODE = os.environ.get('CDA_HEADLESS', '')
+HEADLESS = MODE not in ('', '0')
+REALTIME = MODE != 'fast'
+DIALOG_TEXT = os.environ.get('CDA_HEADLESS_TEXT', '1')
+DIALOG_ANSWERS = json.loads(os.environ['CDA_HEADLESS_DIALOG']) if os.environ.get('CDA_HEADLESS_DIALOG') else None
+
+LOG = {'flip_times': [], 'draws': [], 'work': [], 'port_times': [], 'port_codes': []}
+
+
+def save_log(path):
+    """ Save LOG as arrays in a .npz """
+    np.savez(path, **dict((name, np.array(values)) for name, values in LOG.items()))
+
+
+class Monitor(object):
+    """ Stands in for psychopy.monitors.Monitor """
+    def __init__(self, name, width=None, distance=None, **kwargs):
+        self.name, self.width, self.distance = name, width, distance
+        self.size = None
+
+    def setSizePix(self, size):
+        self.size = size
+
+
+class Window(object):
+    """
+    Stands in for psychopy.visual.Window. flip() calls the callOnFlip
+    functions and records the flip in LOG.
+    """
+    def __init__(self, size=(1920, 1080), monitor=None, frame_rate=60, realtime=REALTIME, units='cm', color=(0, 0, 0), **kwargs):
+        self.size = np.array(monitor.size if monitor is not None and monitor.size is not None else size)
+        self.monitor = monitor
+        self.frame_rate = frame_rate
+        self.realtime = realtime
+        self.units = units
+        self.color = color
+        self.to_call = []
+        self.drawn = 0  # stimuli drawn since the last flip
+        self.last_flip = core.getTime()
+
+    def callOnFlip(self, function, *args, **kwargs):
+        self.to_call.append((function, args, kwargs))
+
+    def flip(self, clearBuffer=True):
+        """ Wait for the next simulated refresh if realtime. Returns the flip time like Window.flip. """
+        now = core.getTime()
+        work = now - self.last_flip
+        if self.realtime:
+            frames = max(1, int(np.ceil(work * self.frame_rate)))  # a late frame is shown a refresh later, like a dropped frame
+            core.wait(self.last_flip + frames / self.frame_rate - now, hogCPUperiod=0)
+        flip_time = core.getTime()
+        for function, args, kwargs in self.to_call:
+            function(*args, **kwargs)
+        self.to_call = []
+        LOG['flip_times'].append(flip_time)
+        LOG['draws'].append(self.drawn)
+        LOG['work'].append(work)
+        self.drawn = 0
+        self.last_flip = flip_time if not self.realtime else self.last_flip + frames / self.frame_rate
+        return flip_time
+
+    def getActualFrameRate(self, *args, **kwargs):
+        return self.frame_rate
+
+    def setMouseVisible(self, visible):
+        pass
+
+    def close(self):
+        pass
+
+
+class Stim(object):
+    """ Stands in for psychopy stimuli. Keeps its keyword arguments as attributes. """
+    def __init__(self, win, **kwargs):
+        self.win = win
+        self.size = np.array((1.0, 1.0))
+        self.__dict__.update(kwargs)
+
+    def draw(self, win=None):
+        self.win.drawn += 1
+
+    def setAutoDraw(self, value):
+        pass
+
+Rect = Circle = ShapeStim = TextStim = ImageStim = Stim
+
+
+class RectArray(Stim):
+    """ Stands in for tools.stimarray.RectArray """
+    def __init__(self, win, size, n_max, **kwargs):
+        super(RectArray, self).__init__(win, sizes=size, **kwargs)
+        self.n_max = n_max
+
+    def set_rects(self, xys, oris, colors):
+        if len(xys) > self.n_max:
+            raise ValueError('%i rectangles do not fit in an array of %i' % (len(xys), self.n_max))
+        self.xys, self.oris, self.colors = np.array(xys), np.array(oris), list(colors)
+
+
+class BarcodePulse(Stim):
+    """ Stands in for tools.barcode.BarcodePulse """
+    def __init__(self, win, **kwargs):
+        super(BarcodePulse, self).__init__(win, **kwargs)
+        self.fillColor = 'black'
+        self.utc_timestamps = []
+
+
+class SimulatedMouse(object):
+    """
+    Stands in for psychopy.event.Mouse. After every clickReset, the simulated
+    subject presses one of buttons after a random rt (seconds) and holds it
+    for hold seconds, again and again until the next clickReset.
+    """
+    def __init__(self, rt=(0.3, 0.9), hold=0.1, buttons=(0, 2), seed=0):
+        self.rt = rt
+        self.hold = hold
+        self.buttons = buttons
+        self.rng = np.random.RandomState(seed)
+        self.mouseClock = core.Clock()
+        self.clickReset()
+
+    def clickReset(self, buttons=(0, 1, 2)):
+        self.mouseClock.reset()
+        self.presses = []  # (start, button) relative to the reset
+
+    def _press_at(self, now):
+        """ The press going on at mouseClock time now or None. Plans presses as needed. """
+        while not self.presses or self.presses[-1][0] + self.hold <= now:
+            start = (self.presses[-1][0] + self.hold if self.presses else 0) + self.rng.uniform(*self.rt)
+            self.presses.append((start, self.buttons[self.rng.randint(len(self.buttons))]))
+            if start > now:
+                return None
+        start, button = self.presses[-1]
+        return (start, button) if start <= now else None
+
+    def getPressed(self, getTime=False):
+        press = self._press_at(self.mouseClock.getTime())
+        pressed, times = [0, 0, 0], [0.0, 0.0, 0.0]
+        if press is not None:
+            pressed[press[1]] = 1
+            times[press[1]] = press[0]
+        return (pressed, times) if getTime else pressed
+
+    def setVisible(self, visible):
+        pass
+
+    def getPos(self):
+        return np.array((0.0, 0.0))
+
+
+class SimulatedKeyboard(object):
+    """
+    Stands in for the psychopy.event module. No key is ever pressed, but
+    waitKeys answers at once with the first key of prefer in keyList (by
+    default 'c' to continue after the practice) or the first of keyList.
+    """
+    def __init__(self, mouse, prefer=('c', )):
+        self.mouse = mouse
+        self.prefer = prefer
+
+    def Mouse(self, *args, **kwargs):
+        return self.mouse
+
+    def clearEvents(self, eventType=None):
+        pass
+
+    def getKeys(self, keyList=None, timeStamped=False):
+        return []
+
+    def waitKeys(self, maxWait=float('inf'), keyList=None, timeStamped=False):
+        for key in self.prefer:
+            if keyList is None or key in keyList:
+                return [key]
+        return [keyList[0]]
+
+
+class SimulatedParallel(object):
+    """ Stands in for psychopy.parallel. Records the writes in LOG. """
+    def setPortAddress(self, address):
+        pass
+
+    def setData(self, code):
+        LOG['port_times'].append(core.getTime())
+        LOG['port_codes'].append(code)
+
+
+class Dlg(object):
+    """ Stands in for psychopy.gui.Dlg. show() answers every field (see module docstring). """
+    def __init__(self, title='', **kwargs):
+        self.fields = []
+        self.OK = True
+
+    def addText(self, text, **kwargs):
+        pass
+
+    def addField(self, label, initial='', choices=None, **kwargs):
+        self.fields.append(choices[0] if choices else (initial or DIALOG_TEXT))
+
+    def show(self):
+        return list(DIALOG_ANSWERS) if DIALOG_ANSWERS is not None else list(self.fields)
+
+
+class Gui(object):
+    """ Stands in for the psychopy.gui module """
+    Dlg = Dlg
+
+    def warnDlg(self, prompt='', **kwargs):
+        raise RuntimeError('headless dialog was rejected: %s' % prompt)  # would ask again forever
+
+
+def psychopy_module(name):
+    """ psychopy.<name> or its stand-in in headless mode. name is 'visual', 'monitors', 'event', 'gui' or 'parallel'. """
+    if not HEADLESS:
+        return importlib.import_module('psychopy.' + name)
+    return {'visual': sys.modules[__name__], 'monitors': sys.modules[__name__], 'event': event, 'gui': gui, 'parallel': parallel}[name]
+
+
+mouse = SimulatedMouse()
+event = SimulatedKeyboard(mouse)
+parallel = SimulatedParallel()
+gui = Gui()
+
+if HEADLESS and os.environ.get('CDA_HEADLESS_LOG'):
+    atexit.register(save_log, os.environ['CDA_HEADLESS_LOG'])
+
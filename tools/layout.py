@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+This module places the rectangles of the memory array in one hemifield.
+
+Items are placed one at a time and every candidate is checked against the
+already placed items of all layouts in one NumPy operation. Only the layouts
+whose candidate collided are redrawn, so thousands of layouts can be produced
+per call instead of brute forcing all N coordinates until they happen to fit.
+"""
+
+from __future__ import division
+import numpy as np
+
+# Field parameters. Same rules as in the experiment scripts.
+MIN_DIST = 2.3  # cm
+FIELD_HEIGHT = 7.6  # cm from bottom to top
+FIELD_WIDTH = 4.8  # cm from center to extreme
+CENTER_DIST = 1.5  # distance from vertical centerline to closest possible rect
+DECIMALS = 3  # coordinates are rounded before the distance check
+
+MAX_CANDIDATES = 100  # candidates per item before a layout is restarted
+MAX_RESTARTS = 50  # restarts of a layout before giving up
+PROBE_LAYOUTS = 200  # layouts filled to find how many items the sampler can place
+MIN_SUCCESS = 0.25  # fraction of attempts that must place all items. 50 restarts then practically never fail
+HEX_DENSITY = np.pi / (2 * np.sqrt(3))  # densest packing of discs in the plane
+
+
+def max_items(min_dist=MIN_DIST, field_width=FIELD_WIDTH, field_height=FIELD_HEIGHT):
+    """
+    Upper bound on the number of items that fit in one hemifield.
+    Every item owns a disc of radius min_dist/2 which may stick out of the field
+    by at most min_dist/2 on each side. No layout can pack discs denser than a
+    hexagonal grid.
+    """
+    if min_dist <= 0:
+        return float('inf')
+    area = (field_width + min_dist) * (field_height + min_dist)
+    disc = np.pi * (min_dist / 2) ** 2
+    return int(HEX_DENSITY * area / disc)
+
+
+_sampler_limits = {}  # field parameters: sampler_limit
+
+
+def sampler_limit(min_dist=MIN_DIST, field_width=FIELD_WIDTH, field_height=FIELD_HEIGHT, center_dist=CENTER_DIST):
+    """
+    Most items the sampler places in at least MIN_SUCCESS of its attempts,
+    found by filling PROBE_LAYOUTS layouts until an item has no free spot in
+    MAX_CANDIDATES candidates. Placing items one at a time at random jams well
+    below max_items, so sample_layouts does not try to place more. Cached per field.
+    """
+    bound = max_items(min_dist, field_width, field_height)
+    if bound == float('inf'):
+        return bound
+    key = (min_dist, field_width, field_height, center_dist)
+    if key not in _sampler_limits:
+        rng = np.random.RandomState(0)  # the same limit every time. Leaves the caller's rng alone.
+        coords = np.empty((PROBE_LAYOUTS, bound, 2))
+        layouts = np.arange(PROBE_LAYOUTS)
+        placed = bound
+        for k in range(bound):
+            layouts = layouts[~_place_item(coords, layouts, k, 1, rng, min_dist, field_width, field_height, center_dist)]
+            if len(layouts) < MIN_SUCCESS * PROBE_LAYOUTS:
+                placed = k
+                break
+        _sampler_limits[key] = placed
+    return _sampler_limits[key]
+
+
+def _place_item(coords, layouts, k, side, rng, min_dist, field_width, field_height, center_dist):
+    """
+    Draw item k of the layouts until it is min_dist from items 0 to k-1, at
+    most MAX_CANDIDATES times. Returns a bool array: whether it failed.
+    """
+    pending = np.arange(len(layouts))  # positions in layouts still being placed
+    for candidate in range(MAX_CANDIDATES):
+        if not len(pending):
+            break
+        current = layouts[pending]
+        xs = np.round(rng.uniform(center_dist, center_dist + field_width, len(current)) * side, DECIMALS)
+        ys = np.round(rng.uniform(-field_height / 2, field_height / 2, len(current)), DECIMALS)
+        coords[current, k, 0] = xs
+        coords[current, k, 1] = ys
+
+        # Squared distance from the candidates to the items already placed
+        delta = coords[current, :k] - coords[current, k:k + 1]
+        ok = ((delta ** 2).sum(axis=2) >= min_dist ** 2).all(axis=1)
+        pending = pending[~ok]
+    failed = np.zeros(len(layouts), dtype=bool)
+    failed[pending] = True
+    return failed
+
+
+def sample_layouts(n_layouts, N, side, rng=np.random, min_dist=MIN_DIST,
+                   field_width=FIELD_WIDTH, field_height=FIELD_HEIGHT,
+                   center_dist=CENTER_DIST):
+    """
+    Returns an array of shape (n_layouts, N, 2) with (x, y) coordinates in cm,
+    rounded to DECIMALS, where all pairwise distances within a layout are
+    at least min_dist.
+
+    :n_layouts: int. Number of independent layouts.
+    :N: int. Number of items per layout.
+    :side: -1 for the left and 1 for the right hemifield.
+    :rng: np.random or a np.random.RandomState. Source of the coordinates.
+    Raises ValueError if N items cannot be placed with these field parameters
+    or more than the sampler can place (see sampler_limit).
+    """
+    if N > max_items(min_dist, field_width, field_height):
+        raise ValueError('%i items cannot be %.2f cm apart in a %.2f x %.2f cm field'
+                         % (N, min_dist, field_width, field_height))
+    limit = sampler_limit(min_dist, field_width, field_height, center_dist)
+    if N > limit:
+        raise ValueError('the sampler cannot place %i items %.2f cm apart in a %.2f x %.2f cm field. '
+                         'Placed one at a time at random, they reliably fit %i items'
+                         % (N, min_dist, field_width, field_height, limit))
+
+    coords = np.empty((n_layouts, N, 2))
+    todo = np.arange(n_layouts)  # layouts which still need to be (re)started
+    for restart in range(MAX_RESTARTS):
+        if not len(todo):
+            break
+        failed = np.zeros(len(todo), dtype=bool)
+        for k in range(N):
+            pending = np.flatnonzero(~failed)  # positions in todo still being placed
+            failed[pending] = _place_item(coords, todo[pending], k, side, rng, min_dist, field_width, field_height,
+                                          center_dist)  # dead ends are restarted from scratch
+        todo = todo[failed]
+    else:
+        if len(todo):
+            raise ValueError('the sampler gave up placing %i items %.2f cm apart in a %.2f x %.2f cm field after %i restarts'
+                             % (N, min_dist, field_width, field_height, MAX_RESTARTS))
+    return coords
+
+
+def spaced_xys(N, side, rng=np.random, **field):
+    """
+    N coordinates in one hemifield that meet the MIN_DIST criterion.
+    Drop-in for the old brute force: returns a list of (x, y) tuples.
+    Keyword arguments override the field parameters (see sample_layouts).
+    """
+    return [tuple(xy) for xy in sample_layouts(1, N, side, rng, **field)[0].tolist()]
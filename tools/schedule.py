@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+This module compiles a trial into a flat frame schedule (a display list) and
+plays it.
+
+A trial is a sequence of phases, each shown for a number of frames. Compiling
+resolves everything a phase needs ahead of time: the draw methods of its
+stimuli, attributes to set when it starts (e.g. the barcode colour), the
+callbacks for its first flip and the triggers to send on it. Playing a frame
+is then just calling the draw methods, lining up the callbacks and flipping.
+
+The schedule does not depend on psychopy itself. Any flip function can play
+it, e.g. one of a headless window, to check what a trial shows on which frame.
+
+Usage:
+    schedule = FrameSchedule([
+        Phase('ITI', 60, (barcode, fix), settings=((barcode, 'fillColor', 'black'), )),
+        Phase('cue', 12, (barcode, arrow, fix), callbacks=((record, (trial, 'cue')), ), triggers=((21, 1), )),
+    ])
+    for code, onset_flip, width_frames in schedule.triggers:
+        triggers.schedule(code, onset_flip, width_frames)
+    flip_times = schedule.play(frame_timer.flip, win.callOnFlip)
+"""
+
+from collections import namedtuple
+
+
+class Phase(namedtuple('Phase', 'name n_frames stimuli settings callbacks triggers')):
+    """
+    :name: str. Passed to the flip function, e.g. the FrameTimer phase.
+    :n_frames: int. Number of frames the phase is shown.
+    :stimuli: objects with a draw() method, drawn in this order on every frame.
+    :settings: (object, attribute, value) to set before the first frame.
+    :callbacks: (function, args) to call on the first flip.
+    :triggers: (code, width_frames) to send on the first flip.
+    """
+    def __new__(cls, name, n_frames, stimuli, settings=(), callbacks=(), triggers=()):
+        return super(Phase, cls).__new__(cls, name, n_frames, tuple(stimuli), tuple(settings), tuple(callbacks), tuple(triggers))
+
+
+class FrameSchedule(object):
+    """ One entry per frame of a trial: the phase, the draw methods and, on phase onsets, settings and callbacks """
+    def __init__(self, phases):
+        self.phases = []  # name of the phase of every frame
+        self.draws = []  # draw methods of every frame
+        self.settings = {}  # frame: settings to apply before drawing it
+        self.callbacks = {}  # frame: callbacks to line up for its flip
+        self.onsets = {}  # phase name: first frame
+        self.triggers = []  # (code, onset_flip, width_frames), e.g. for TriggerScheduler.schedule
+        for phase in phases:
+            onset = len(self.phases)
+            self.onsets.setdefault(phase.name, onset)
+            draws = tuple(stimulus.draw for stimulus in phase.stimuli)
+            self.phases.extend([phase.name] * phase.n_frames)
+            self.draws.extend([draws] * phase.n_frames)
+            if phase.settings:
+                self.settings[onset] = phase.settings
+            if phase.callbacks:
+                self.callbacks[onset] = phase.callbacks
+            self.triggers.extend((code, onset, width_frames) for code, width_frames in phase.triggers)
+
+    def __len__(self):
+        return len(self.phases)
+
+    def play_frame(self, frame, flip, call_on_flip):
+        """
+        Draw frame, line up its callbacks with call_on_flip(function, *args)
+        and show it with flip(phase). Returns what flip returns.
+        """
+        for obj, attribute, value in self.settings.get(frame, ()):
+            setattr(obj, attribute, value)
+        for draw in self.draws[frame]:
+            draw()
+        for function, args in self.callbacks.get(frame, ()):
+            call_on_flip(function, *args)
+        return flip(self.phases[frame])
+
+    def play(self, flip, call_on_flip, start=0, stop=None):
+        """ Play the frames from start up to, not including, stop (the end by default). Returns the flip times. """
+        stop = len(self) if stop is None else stop
+        return [self.play_frame(frame, flip, call_on_flip) for frame in range(start, stop)]
+
+    def remove(self, stimulus, start):
+        """ Stop drawing stimulus from frame start on, e.g. when the display should change at a response """
+        self.draws[start:] = [tuple(draw for draw in draws if draw != stimulus.draw) for draws in self.draws[start:]]
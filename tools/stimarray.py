@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+This module draws all rectangles of a memory or probe array in one call.
+
+Setting pos, ori and fillColor on a single Rect makes psychopy recompute its
+vertices and colours for every rectangle on every frame. RectArray instead
+takes the positions, orientations and colours of a trial once (e.g. during
+the ITI) and draws them as one ElementArrayStim, so the per-frame cost does
+not grow with the set size.
+"""
+
+from __future__ import division
+import numpy as np
+from psychopy.visual import ElementArrayStim
+
+try:
+    from psychopy.colors import colorNames  # named colours in rgb (-1 to 1)
+except ImportError:
+    from psychopy.colors import colors as colorNames  # older psychopy
+
+
+class RectArray(ElementArrayStim):
+    """
+    Up to n_max equally sized, solid rectangles.
+    Unused elements are kept transparent so the arrays never change size.
+    """
+    def __init__(self, win, size, n_max, **kwargs):
+        kwargs['nElements'] = n_max
+        kwargs['sizes'] = size
+        kwargs['elementTex'] = None
+        kwargs['elementMask'] = None
+        kwargs['colorSpace'] = 'rgb'
+        kwargs.setdefault('fieldSize', (100, 100))  # just needs to contain all rects
+        super(RectArray, self).__init__(win, **kwargs)
+        self.n_max = n_max
+        self._xys = np.zeros((n_max, 2))
+        self._oris = np.zeros(n_max)
+        self._colors = np.zeros((n_max, 3))
+        self._opacities = np.zeros(n_max)
+        self._rgb = {}  # cache of colour names to rgb
+
+    def rgb(self, color):
+        """ rgb (-1 to 1) of a colour name """
+        if color not in self._rgb:
+            self._rgb[color] = np.array(colorNames[color.lower()], dtype=float)
+        return self._rgb[color]
+
+    def set_rects(self, xys, oris, colors):
+        """ Set the rectangles to draw. Call this outside of time-critical frames. """
+        n = len(xys)
+        if n > self.n_max:
+            raise ValueError('%i rectangles do not fit in an array of %i' % (n, self.n_max))
+        self._xys[:n] = xys
+        self._oris[:n] = oris
+        self._colors[:n] = [self.rgb(color) for color in colors]
+        self._opacities[:n] = 1
+        self._opacities[n:] = 0
+        self.setXYs(self._xys)
+        self.setOris(self._oris)
+        self.setColors(self._colors, 'rgb')
+        self.setOpacities(self._opacities)
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+This module stores trial banks in a compact binary format which can be
+memory-mapped, so that opening a bank and selecting one visit (dataset version)
+only reads that visit from disk.
+
+A bank is a folder next to the JSON file (T=...,R=....bank) holding
+ * trials.npy: one fixed-width record per trial (TRIAL_DTYPE), sorted by visit
+ * visits.npy: offsets of the visits into trials.npy
+ * xys.npy, oris.npy, colors.npy, targets.npy: the ragged per-item arrays of
+   all trials concatenated. Each trial record points to its start.
+ * meta.json: format version and the names behind the index columns.
+
+Usage:
+    bank = TrialBank('trials/T=(2, 3),D=(0, 2),B=5,R=3.bank')
+    trial_list = bank[dataset_idx]  # same as json.load(f)[dataset_idx]
+
+Convert existing JSON banks with
+    python tools/trialbank.py trials/*.json
+
+Generated banks are registered in a BankIndex: index.json in the trials folder
+maps the generation parameters (targets, distractors, blocks, repetitions,
+seed, generator version) to the content hash of the bank, which is stored as
+<hash>.bank. Lookups are a dict access, and missing banks can be generated in
+a background thread with BankIndex.prefetch.
+"""
+
+from __future__ import division
+import os
+import sys
+import json
+import hashlib
+import threading
+import numpy as np
+
+FORMAT_VERSION = 1
+BANK_EXTENSION = '.bank'
+INDEX_FILENAME = 'index.json'
+CUES = ['left', 'right']
+PROBE_TYPES = ('same', 'change')
+
+TRIAL_DTYPE = np.dtype([
+    ('visit', 'i2'), ('block', 'i2'), ('CueSide', 'i1'), ('Probe', 'i1'),
+    ('numTargets', 'i2'), ('numDistracts', 'i2'), ('Condition', 'i2'), ('ProbeCode', 'i2'),
+    ('probe_id', 'i2'), ('probe_ori', 'i2'), ('item_start', 'i8'), ('target_start', 'i8')
+])
+
+
+def bank_path(json_path):
+    """ Path of the binary bank belonging to a JSON trials file """
+    return os.path.splitext(json_path)[0] + BANK_EXTENSION
+
+
+def save_bank(full_trial_list, path):
+    """
+    Store a full trial list (visits of blocks of trial dicts, as written by
+    CDA_generate_trials.py) as a binary bank in the folder path.
+    """
+    trials = [(visit, trial) for visit, current_day in enumerate(full_trial_list)
+              for current_block in current_day for trial in current_block]
+    colors = []  # palette in order of appearance
+    for visit, trial in trials:
+        colors.extend(color for color in trial['colors'] if color not in colors)
+
+    records = np.zeros(len(trials), dtype=TRIAL_DTYPE)
+    n_items = [len(trial['xys']) for visit, trial in trials]
+    n_targets = [len(trial['targets']) for visit, trial in trials]
+    records['item_start'] = np.cumsum([0] + n_items[:-1])
+    records['target_start'] = np.cumsum([0] + n_targets[:-1])
+    for i, (visit, trial) in enumerate(trials):
+        records[i]['visit'] = visit
+        for key in ('block', 'numTargets', 'numDistracts', 'Condition', 'ProbeCode', 'probe_id', 'probe_ori'):
+            records[i][key] = trial[key]
+        records[i]['CueSide'] = CUES.index(trial['CueSide'])
+        records[i]['Probe'] = PROBE_TYPES.index(trial['Probe'])
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    np.save(os.path.join(path, 'trials.npy'), records)
+    np.save(os.path.join(path, 'visits.npy'), np.searchsorted(records['visit'], np.arange(len(full_trial_list) + 1)))
+    np.save(os.path.join(path, 'xys.npy'), np.array([xy for visit, trial in trials for xy in trial['xys']], dtype='f8').reshape(-1, 2))
+    np.save(os.path.join(path, 'oris.npy'), np.array([ori for visit, trial in trials for ori in trial['oris']], dtype='i2'))
+    np.save(os.path.join(path, 'colors.npy'), np.array([colors.index(color) for visit, trial in trials for color in trial['colors']], dtype='u1'))
+    np.save(os.path.join(path, 'targets.npy'), np.array([target for visit, trial in trials for target in trial['targets']], dtype='i2'))
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump({'version': FORMAT_VERSION, 'cues': CUES, 'probe_types': PROBE_TYPES, 'colors': colors}, f)
+    return path
+
+
+def json_to_bank(json_path, path=None):
+    """ Convert a JSON trials file to a binary bank. Returns the path of the bank. """
+    with open(json_path) as f:
+        full_trial_list = json.load(f)
+    return save_bank(full_trial_list, path or bank_path(json_path))
+
+
+class TrialBank(object):
+    """
+    Read-only view of a binary bank. All arrays are memory-mapped, so only
+    the pages of the selected visit are read.
+    """
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        if self.meta['version'] != FORMAT_VERSION:
+            raise ValueError('%s has format version %s, expected %s' % (path, self.meta['version'], FORMAT_VERSION))
+        load = lambda name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+        self.trials = load('trials')
+        self.visits = np.array(load('visits'))
+        self.xys = load('xys')
+        self.oris = load('oris')
+        self.colors = load('colors')
+        self.targets = load('targets')
+
+    def __len__(self):
+        """ Number of visits (dataset versions) """
+        return len(self.visits) - 1
+
+    def visit_arrays(self, idx):
+        """ The trial records and ragged arrays of one visit as in-memory arrays """
+        if not 0 <= idx < len(self):
+            raise IndexError('bank has %i visits, not %i' % (len(self), idx + 1))
+        records = np.array(self.trials[self.visits[idx]:self.visits[idx + 1]])
+        if not len(records):
+            empty = np.zeros(0)
+            return records, empty.reshape(0, 2), empty, empty, empty
+        n_items = 2 * (records['numTargets'].astype(int) + records['numDistracts'])
+        items = slice(records['item_start'][0], records['item_start'][-1] + n_items[-1])
+        targets = slice(records['target_start'][0], records['target_start'][-1] + 2 * records['numTargets'][-1])
+        return records, np.array(self.xys[items]), np.array(self.oris[items]), np.array(self.colors[items]), np.array(self.targets[targets])
+
+    def __getitem__(self, idx):
+        """ Trials of one visit as a list of blocks of trial dicts, like the JSON file """
+        records, xys, oris, colors, targets = self.visit_arrays(idx)
+        cues, probe_types, palette = self.meta['cues'], self.meta['probe_types'], self.meta['colors']
+        item_start = records['item_start'] - (records['item_start'][0] if len(records) else 0)
+        target_start = records['target_start'] - (records['target_start'][0] if len(records) else 0)
+        xys, oris, colors, targets = xys.tolist(), oris.tolist(), [palette[color] for color in colors], targets.tolist()
+
+        current_day = []
+        for record, item, target in zip(records.tolist(), item_start.tolist(), target_start.tolist()):
+            record = dict(zip(TRIAL_DTYPE.names, record))
+            n_items = 2 * (record['numTargets'] + record['numDistracts'])
+            trial = {
+                'CueSide': cues[record['CueSide']],
+                'block': record['block'],
+                'numTargets': record['numTargets'],
+                'numDistracts': record['numDistracts'],
+                'Probe': probe_types[record['Probe']],
+                'Condition': record['Condition'],
+                'ProbeCode': record['ProbeCode'],
+                'xys': xys[item:item + n_items],
+                'oris': oris[item:item + n_items],
+                'colors': colors[item:item + n_items],
+                'targets': targets[target:target + 2 * record['numTargets']],
+                'probe_id': record['probe_id'],
+                'probe_ori': record['probe_ori']
+            }
+            if not current_day or current_day[-1][-1]['block'] != trial['block']:
+                current_day.append([])
+            current_day[-1].append(trial)
+        return current_day
+
+
+def open_trials(json_path):
+    """
+    Open the binary bank belonging to a JSON trials file, converting the JSON
+    on first use. Returns None if neither exists.
+    """
+    path = bank_path(json_path)
+    if not os.path.isfile(os.path.join(path, 'meta.json')):
+        if not os.path.isfile(json_path):
+            return None
+        json_to_bank(json_path, path)
+    return TrialBank(path)
+
+
+def content_hash(full_trial_list):
+    """ sha1 of the canonical JSON of a full trial list """
+    return hashlib.sha1(json.dumps(full_trial_list, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class BankIndex(object):
+    """
+    Manifest of the banks in a trials folder, keyed by generation parameters.
+    """
+    def __init__(self, folder='trials'):
+        self.folder = folder
+        self.path = os.path.join(folder, INDEX_FILENAME)
+        self.lock = threading.Lock()
+        self.pending = {}  # key: thread generating the bank
+        self.errors = {}  # key: exception of a failed prefetch, raised by wait
+        self.entries = self._read()
+
+    @staticmethod
+    def key(Ntargets, Ndistractors, Nblocks, Nrepetitions, seed, version):
+        """ Index key, e.g. 'T=(2, 3),D=(0, 2),B=5,R=3,seed=7,v=2' """
+        return 'T=%s,D=%s,B=%i,R=%i,seed=%i,v=%i' % (tuple(Ntargets), tuple(Ndistractors), Nblocks, Nrepetitions, seed, version)
+
+    def _read(self):
+        if not os.path.isfile(self.path):
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        """ TrialBank registered under key or None """
+        entry = self.entries.get(key)
+        return None if entry is None else TrialBank(os.path.join(self.folder, entry['file']))
+
+    def add(self, key, full_trial_list):
+        """ Store a full trial list under its content hash and register it under key """
+        digest = content_hash(full_trial_list)
+        filename = digest + BANK_EXTENSION
+        if not os.path.isfile(os.path.join(self.folder, filename, 'meta.json')):
+            save_bank(full_trial_list, os.path.join(self.folder, filename))
+
+        with self.lock:
+            # Merge with banks added by other processes meanwhile and replace the file in one step
+            self.entries = dict(self._read(), **self.entries)
+            self.entries[key] = {'hash': digest, 'file': filename}
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump(self.entries, f, indent=1, sort_keys=True)
+            if os.path.exists(self.path):
+                os.remove(self.path)  # rename does not overwrite on Windows
+            os.rename(self.path + '.tmp', self.path)
+        return self.get(key)
+
+    def prefetch(self, key, generate):
+        """
+        Generate a missing bank in a background thread.
+        generate() is called without arguments and returns the full trial list.
+        If it fails, the next wait(key) raises its exception.
+        """
+        with self.lock:
+            if key in self.entries or key in self.pending:
+                return
+            self.errors.pop(key, None)
+            thread = threading.Thread(target=self._generate, args=(key, generate))
+            thread.daemon = True
+            self.pending[key] = thread
+        thread.start()
+
+    def _generate(self, key, generate):
+        try:
+            self.add(key, generate())
+        except Exception as err:
+            self.errors[key] = err
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+
+    def wait(self, key):
+        """ Like get, but waits for a pending prefetch of key first and raises what it raised """
+        thread = self.pending.get(key)
+        if thread is not None:
+            thread.join()
+        error = self.errors.pop(key, None)
+        if error is not None:
+            raise error
+        return self.get(key)
+
+
+if __name__ == '__main__':
+    for json_path in sys.argv[1:]:
+        print('wrote %s' % json_to_bank(json_path))